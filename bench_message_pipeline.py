@@ -0,0 +1,128 @@
+"""Per-message CPU cost of the gateway message path, before and after the pipeline.
+
+Feeds raw MESSAGE_CREATE payloads through discord.py's parser on a bot that
+never connects, and waits for every dispatched handler to finish.
+
+"before" is the previous setup: the default 1000-message cache and three
+on_message listeners (main.py's lowercase copy, /chat buffering and the story
+game DM check), each run as its own task by discord.py. "after" is the
+current setup: no message cache and a single listener feeding the
+MessagePipeline, with the /chat, snipe and story game subscriptions.
+
+    python bench_message_pipeline.py [messages]
+"""
+import asyncio
+import sys
+import time
+import discord
+from discord.ext import commands
+import message_pipeline
+from chatgpt import ChannelHistoryCache
+from snipe import SentMessages
+
+GUILD_ID = 1 << 40
+CHANNELS = 50
+CHAT_CHANNELS = 5
+
+
+def payload(i):
+    return {
+        "id": str((i + 1) << 22),
+        "channel_id": str(1000 + i % CHANNELS),
+        "guild_id": str(GUILD_ID),
+        "author": {"id": str(500 + i % 200), "username": f"user{i % 200}", "discriminator": "0",
+                   "avatar": None, "bot": False},
+        "content": f"message number {i} with a little bit of text in it",
+        "timestamp": "2026-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def history():
+    buffers = ChannelHistoryCache()
+    for channel_id in range(1000, 1000 + CHAT_CHANNELS):
+        buffers.seed(channel_id, [])
+    return buffers
+
+
+def before_bot():
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.all(), max_messages=1000)
+    buffers = history()
+    turns = {}
+
+    @bot.event
+    async def on_message(message):
+        if message.author == bot.user:
+            return
+
+        content = message.content.lower()
+
+    async def chat_on_message(message):
+        if message.channel.id in buffers:
+            buffers.add(message.channel.id, message.id, message.content)
+
+    async def story_on_message(message):
+        if message.guild is not None:
+            return
+        turns.get(message.author.id)
+
+    bot.add_listener(chat_on_message, 'on_message')
+    bot.add_listener(story_on_message, 'on_message')
+    return bot
+
+
+def after_bot():
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.all(), max_messages=None)
+    pipeline = message_pipeline.attach(bot)
+    buffers = history()
+    sent = SentMessages()
+    turns = {}
+
+    def buffer_message(message):
+        buffers.add(message.channel.id, message.id, message.content)
+
+    pipeline.subscribe(buffer_message, guilds=True, dms=True, channels=buffers)
+    pipeline.subscribe(sent.add, guilds=True, ignore_bots=True)
+    pipeline.subscribe(lambda message: None, dms=True, authors=turns)
+
+    @bot.event
+    async def on_message(message):
+        pipeline.dispatch(message)
+
+    return bot
+
+
+async def measure(bot, payloads):
+    await bot._async_setup_hook()
+    state = bot._connection
+    # Let the parser resolve the guild so messages look like real guild messages.
+    state._add_guild(discord.Guild(data={"id": str(GUILD_ID), "name": "bench"}, state=state))
+    started = time.process_time()
+    for i in range(0, len(payloads), 500):
+        for data in payloads[i:i + 500]:
+            state.parse_message_create(data)
+        while len(asyncio.all_tasks()) > 1:
+            await asyncio.sleep(0)
+    return (time.process_time() - started) / len(payloads)
+
+
+async def main(count):
+    payloads = [payload(i) for i in range(count)]
+    await measure(after_bot(), payloads[:1000])
+    before = await measure(before_bot(), payloads)
+    after = await measure(after_bot(), payloads)
+    print(f"{count} messages")
+    print(f"before: {before * 1e6:7.1f} us/message")
+    print(f"after:  {after * 1e6:7.1f} us/message ({(1 - after / before) * 100:.0f}% less)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
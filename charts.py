@@ -0,0 +1,169 @@
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ChartQueueFull(Exception):
+    pass
+
+
+class ChartRenderFailed(Exception):
+    pass
+
+
+def render_chart(data_type, rows):
+    # Runs inside a worker process. Only the object-oriented Agg API is used,
+    # so no figure is ever registered with pyplot's global state.
+    import pandas as pd
+    import seaborn as sns
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if data_type == "sleep":
+        df = pd.DataFrame(rows, columns=["date", "hours_slept", "score"])
+        df['date'] = pd.to_datetime(df['date'])
+
+        fig = Figure(figsize=(10, 12))
+        ax1, ax2 = fig.subplots(2, 1)
+        sns.lineplot(data=df, x="date", y="hours_slept", ax=ax1)
+        ax1.set_title("Sleep Duration Over Time")
+        ax1.set_ylabel("Hours Slept")
+
+        sns.lineplot(data=df, x="date", y="score", ax=ax2)
+        ax2.set_title("Sleep Quality Score Over Time")
+        ax2.set_ylabel("Score")
+
+    elif data_type == "diet":
+        df = pd.DataFrame(rows, columns=["date", "calories"])
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.groupby("date").sum().reset_index()
+
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        sns.barplot(data=df, x="date", y="calories", ax=ax)
+        ax.set_title("Daily Calorie Intake")
+        ax.set_ylabel("Calories")
+        ax.tick_params(axis="x", labelrotation=45)
+
+    elif data_type == "exercise":
+        df = pd.DataFrame(rows, columns=["date", "exercise", "total_reps"])
+        df['date'] = pd.to_datetime(df['date'])
+
+        fig = Figure(figsize=(12, 6))
+        ax = fig.subplots()
+        sns.scatterplot(data=df, x="date", y="total_reps", hue="exercise", size="total_reps", sizes=(20, 200), ax=ax)
+        ax.set_title("Exercise Progress Over Time")
+        ax.set_ylabel("Total Reps")
+        ax.tick_params(axis="x", labelrotation=45)
+
+    elif data_type == "body":
+        df = pd.DataFrame(rows, columns=["date", "mass_in_kg", "body_fat_percentage"])
+        df['date'] = pd.to_datetime(df['date'])
+
+        fig = Figure(figsize=(10, 12))
+        ax1, ax2 = fig.subplots(2, 1)
+        sns.lineplot(data=df, x="date", y="mass_in_kg", ax=ax1)
+        ax1.set_title("Body Mass Over Time")
+        ax1.set_ylabel("Mass (kg)")
+
+        sns.lineplot(data=df, x="date", y="body_fat_percentage", ax=ax2)
+        ax2.set_title("Body Fat Percentage Over Time")
+        ax2.set_ylabel("Body Fat %")
+
+    else:
+        raise ValueError(f"Unknown chart type: {data_type}")
+
+    fig.tight_layout()
+    img_stream = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(img_stream)
+    return img_stream.getvalue()
+
+
+class ChartRenderer:
+    def __init__(self, workers=2, queue_depth=16, max_tasks_per_child=200):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor = self._new_executor()
+        self.queue_depth = queue_depth
+        self.pending = 0
+        self.restarts = 0
+
+    def _new_executor(self):
+        # Workers are spawned rather than forked so they never inherit the
+        # bot's event loop or database threads, and are recycled every
+        # max_tasks_per_child renders to keep their memory flat.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+
+    async def render(self, data_type, rows):
+        if self.pending >= self.queue_depth:
+            raise ChartQueueFull()
+        self.pending += 1
+        executor = self._executor
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, render_chart, data_type, list(rows))
+        except BrokenProcessPool as e:
+            # A worker died, e.g. killed for running out of memory, and the
+            # pool refuses all further work. Renders that were queued on it
+            # fail too; only the first of them replaces it.
+            if executor is self._executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                self.restarts += 1
+            raise ChartRenderFailed() from e
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ChartCache:
+    """LRU cache of rendered PNGs bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        png = self._entries.get(key)
+        if png is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return png
+
+    def put(self, key, png):
+        if len(png) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._entries[key] = png
+        self.bytes += len(png)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
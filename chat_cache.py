@@ -0,0 +1,99 @@
+import hashlib
+import re
+import time
+from database import AsyncDatabase
+
+MIGRATIONS = [
+    # 1: cached responses and per-channel opt-outs
+    '''
+    CREATE TABLE IF NOT EXISTS responses
+        (key TEXT PRIMARY KEY, response TEXT, created_at REAL, last_used REAL);
+    CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+    CREATE TABLE IF NOT EXISTS opt_outs
+        (channel_id INTEGER PRIMARY KEY);
+    ''',
+    # 2: keys now include the channel and context; older entries were shared
+    # between channels and are dropped
+    '''
+    DELETE FROM responses;
+    ''',
+]
+
+
+def normalize_prompt(prompt):
+    prompt = re.sub(r"[^\w\s]", "", prompt.lower())
+    return " ".join(prompt.split())
+
+
+def fingerprint(*parts):
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+
+class ResponseCache(AsyncDatabase):
+    """Completions for near-identical prompts, persisted across restarts.
+
+    Keys are scoped to a channel and a fingerprint of the context sent with
+    the prompt, so a reply is never shown outside the conversation it drew on.
+
+    Entries expire ``ttl`` seconds after they were written, and the least
+    recently used entries are dropped beyond ``max_entries``.
+    """
+
+    def __init__(self, path='chat_cache.db', ttl=3600, max_entries=5000):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.opted_out = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def load(self):
+        await self.migrate(MIGRATIONS)
+        rows = await self.fetchall("SELECT channel_id FROM opt_outs")
+        self.opted_out = {row[0] for row in rows}
+
+    def key(self, prompt, channel_id, context_fingerprint):
+        return fingerprint(normalize_prompt(prompt), str(channel_id), context_fingerprint)
+
+    async def get(self, key):
+        def _get(conn):
+            now = time.time()
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                if row[1] < now - self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+        response = await self.run(_get)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def put(self, key, response):
+        def _put(conn):
+            now = time.time()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO responses (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                             (key, response, now, now))
+                conn.execute('''DELETE FROM responses WHERE key IN
+                                (SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)''',
+                             (self.max_entries,))
+        await self.run(_put)
+
+    async def set_opt_out(self, channel_id, opted_out):
+        if opted_out:
+            await self.execute("INSERT OR IGNORE INTO opt_outs (channel_id) VALUES (?)", (channel_id,))
+            self.opted_out.add(channel_id)
+        else:
+            await self.execute("DELETE FROM opt_outs WHERE channel_id = ?", (channel_id,))
+            self.opted_out.discard(channel_id)
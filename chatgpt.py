@@ -1,67 +1,560 @@
-from openai import OpenAI
 import discord
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
+from collections import OrderedDict
+from functools import lru_cache
+import asyncio
+import contextlib
+import logging
 import os
+import random
+import re
+import time
+from chat_cache import ResponseCache, fingerprint
+import hot_reload
+import message_pipeline
+from metrics import OPENAI_REQUEST_DURATION
+import outbound
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 OPENAI_API_KEY = os.getenv('GPT_TOKEN')
 SYSTEM_SETTINGS = """Your name is Maya. You are a female person with lavender hair and golden eyes. You like to wear pastel clothing."""
+MODEL = "gpt-4o-mini"
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+MAX_CONCURRENT_REQUESTS = int(os.getenv('OPENAI_MAX_CONCURRENCY', 4))
+REQUEST_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 30))
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+HISTORY_PER_CHANNEL = int(os.getenv('CHAT_HISTORY_PER_CHANNEL', 100))
+# Upper bound for /chat's message_limit; older messages rarely fit the
+# context budget anyway.
+MAX_MESSAGE_LIMIT = 500
+HISTORY_MAX_BYTES = int(os.getenv('CHAT_HISTORY_MAX_BYTES', 8 * 1024 * 1024))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKENS', 2000))
+MESSAGE_TOKEN_LIMIT = int(os.getenv('CHAT_MESSAGE_TOKENS', 300))
+DISCORD_MESSAGE_LIMIT = 2000
+EMPTY_RESPONSE = "No response was generated."
+# Seconds between progressive edits of a streamed reply, well inside
+# Discord's message edit rate limit.
+STREAM_EDIT_INTERVAL = float(os.getenv('CHAT_STREAM_EDIT_INTERVAL', 1.0))
+RESPONSE_CACHE_ENABLED = os.getenv('CHAT_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', 5000))
+# Cached replies are only reused while the model and persona are unchanged.
+CONTEXT_FINGERPRINT = fingerprint(MODEL, SYSTEM_SETTINGS)
+
+# A code fence's language tag, reopened after a cut. At most 24 characters
+# are carried over while every cut takes over half a message, so each pass of
+# split_message leaves less text than the one before.
+FENCE_TAG = re.compile(r"```[\w+#.-]{0,20}(?=\s|$)|```")
+
+
+def split_message(content, limit=DISCORD_MESSAGE_LIMIT):
+    """Split ``content`` into chunks of at most ``limit`` characters.
+
+    Cuts prefer paragraph breaks, then line breaks, then spaces. A code block
+    that spans a cut is closed at the end of one chunk and reopened, with its
+    language tag, at the start of the next.
+    """
+    chunks = []
+    while len(content) > limit:
+        window = content[:limit - 4]
+        for separator in ("\n\n", "\n", " "):
+            cut = window.rfind(separator)
+            if cut > limit // 2:
+                rest = content[cut + len(separator):]
+                break
+        else:
+            cut = len(window)
+            rest = content[cut:]
+        chunk = content[:cut]
+
+        if chunk.count("```") % 2 == 1:
+            # A fence whose opening line runs on is reopened bare; copying
+            # the whole line would never let the text get shorter.
+            fence = FENCE_TAG.match(chunk, chunk.rfind("```")).group()
+            chunk += "\n```"
+            rest = f"{fence}\n{rest}"
+
+        chunks.append(chunk)
+        content = rest
+    chunks.append(content)
+    return chunks
+
+
+class StreamingReply:
+    """Posts a reply as soon as text arrives and edits it as more streams in.
+
+    Edits are spaced at least ``edit_interval`` seconds apart. Once the text
+    outgrows one message it rolls over into a new one at a split_message
+    boundary.
+    """
+
+    def __init__(self, interaction, edit_interval=STREAM_EDIT_INTERVAL):
+        self.interaction = interaction
+        self.edit_interval = edit_interval
+        self.message = None
+        self.pending = ""
+        self.shown = ""
+        self.last_edit = 0
+
+    async def feed(self, delta):
+        self.pending += delta
+        if self.message is None or time.monotonic() - self.last_edit >= self.edit_interval:
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending.strip():
+            return
+        *complete, self.pending = split_message(self.pending)
+        for chunk in complete:
+            await self.show(chunk)
+            self.message = None
+            self.shown = ""
+        await self.show(self.pending)
+        self.last_edit = time.monotonic()
+
+    async def show(self, content):
+        if self.message is None:
+            self.message = await self.interaction.followup.send(content, wait=True)
+        elif content != self.shown:
+            await self.message.edit(content=content)
+        self.shown = content
+
+
+def format_message(message):
+    return f"{message.author.id} {message.author.name} {message.author.mention} @ {message.created_at.strftime('%Y-%m-%d %H:%M:%S')}: {message.content}"
+
+
+class ContextBuilder:
+    """Fills a token budget with past messages, newest first.
+
+    Tokens are counted with tiktoken when it and its encoding are available,
+    and estimated at four characters per token otherwise. Counts are cached
+    per line, so a channel's messages are only counted once.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, message_limit=MESSAGE_TOKEN_LIMIT):
+        self.token_budget = token_budget
+        self.message_limit = message_limit
+        self._encoding = None
+        self._encoding_task = None
+        self.count_tokens = lru_cache(maxsize=8192)(self._count_tokens)
+
+    @property
+    def encoding(self):
+        # tiktoken is imported on the first /chat, on a worker thread: on a
+        # cold cache it downloads the encoding with no timeout. Requests
+        # estimate until it is ready.
+        if self._encoding_task is None:
+            self._encoding_task = asyncio.ensure_future(asyncio.to_thread(self.load_encoding))
+            self._encoding_task.add_done_callback(self._encoding_loaded)
+        return self._encoding
+
+    def _encoding_loaded(self, task):
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._encoding = task.result()
+            # Drop the counts estimated while it loaded.
+            self.count_tokens.cache_clear()
+
+    @staticmethod
+    def load_encoding():
+        try:
+            import tiktoken
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+    def _count_tokens(self, text):
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text))
+
+    def truncate(self, text, tokens):
+        if self.encoding is None:
+            return text[:tokens * 4] + " [...]"
+        return self.encoding.decode(self.encoding.encode(text)[:tokens]) + " [...]"
+
+    def build(self, lines):
+        """Return the context text, the tokens it uses and the tokens left out."""
+        selected = []
+        used = 0
+        total = 0
+        full = False
+        for line in reversed(lines):
+            tokens = self.count_tokens(line)
+            total += tokens
+            if full:
+                continue
+            if tokens > self.message_limit:
+                line = self.truncate(line, self.message_limit)
+                tokens = self.count_tokens(line)
+            if used + tokens > self.token_budget:
+                full = True
+                continue
+            selected.append(line)
+            used += tokens
+        return "\n".join(reversed(selected)), used, total - used
+
+
+class ChannelHistoryCache:
+    """Recent formatted messages per channel, kept up to date from gateway events.
+
+    A channel is only cached once it has been seeded from its history, so a
+    cached channel always holds its newest ``per_channel`` messages. Idle
+    channels are evicted least recently used first once ``max_bytes`` is hit.
+    Messages sent by the bot itself are stored as ``None`` so they still count
+    towards a request's limit, as they do with ``channel.history``.
+
+    A channel being fetched is started with ``begin`` so events arriving
+    during the fetch are kept; ``seed`` then merges the fetched messages
+    under them.
+    """
+
+    def __init__(self, per_channel=HISTORY_PER_CHANNEL, max_bytes=HISTORY_MAX_BYTES):
+        self.per_channel = per_channel
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._channels = OrderedDict()
+        # Channels still being fetched, with the ids deleted meanwhile.
+        self._loading = {}
+
+    def __contains__(self, channel_id):
+        return channel_id in self._channels
+
+    def begin(self, channel_id):
+        if channel_id not in self._channels:
+            self._channels[channel_id] = OrderedDict()
+            self._loading[channel_id] = set()
+
+    def abort(self, channel_id):
+        if channel_id in self._loading:
+            self.drop(channel_id)
+
+    def seed(self, channel_id, entries):
+        live = self._channels.get(channel_id, {}) if channel_id in self._loading else {}
+        deleted = self._loading.pop(channel_id, set())
+        merged = {message_id: line for message_id, line in entries if message_id not in deleted}
+        merged.update(live)
+        self.drop(channel_id)
+        buffer = self._channels[channel_id] = OrderedDict()
+        # Snowflake ids sort in the order the messages were sent.
+        for message_id in sorted(merged)[-self.per_channel:]:
+            line = buffer[message_id] = merged[message_id]
+            self.bytes += self._size(line)
+        self._enforce_memory_cap()
+
+    def recent(self, channel_id, limit):
+        buffer = self._channels.get(channel_id)
+        if buffer is None or channel_id in self._loading or limit > self.per_channel:
+            return None
+        self._channels.move_to_end(channel_id)
+        if limit <= 0:
+            return []
+        lines = list(buffer.values())[-limit:]
+        return [line for line in lines if line is not None]
+
+    def add(self, channel_id, message_id, line):
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            return
+        self._replace(buffer, message_id, line)
+        while len(buffer) > self.per_channel:
+            _, dropped = buffer.popitem(last=False)
+            self.bytes -= self._size(dropped)
+        self._enforce_memory_cap()
+
+    def edit(self, channel_id, message_id, line):
+        buffer = self._channels.get(channel_id)
+        # While loading, the edited message may only be in the fetched copy.
+        if buffer is not None and (message_id in buffer or channel_id in self._loading):
+            self._replace(buffer, message_id, line)
+            self._enforce_memory_cap()
+
+    def delete(self, channel_id, message_id):
+        if channel_id in self._loading:
+            self._loading[channel_id].add(message_id)
+        buffer = self._channels.get(channel_id)
+        if buffer is not None and message_id in buffer:
+            self.bytes -= self._size(buffer.pop(message_id))
+
+    def drop(self, channel_id):
+        self._loading.pop(channel_id, None)
+        buffer = self._channels.pop(channel_id, None)
+        if buffer is not None:
+            self.bytes -= sum(self._size(line) for line in buffer.values())
+
+    def _replace(self, buffer, message_id, line):
+        if message_id in buffer:
+            self.bytes -= self._size(buffer[message_id])
+        buffer[message_id] = line
+        self.bytes += self._size(line)
+
+    def _enforce_memory_cap(self):
+        while self.bytes > self.max_bytes and self._channels:
+            self.drop(next(iter(self._channels)))
+
+    @staticmethod
+    def _size(line):
+        return len(line) if line else 0
+
 
 class ChatGPTCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        # The openai package is imported on the first request; see load_client.
+        self.client = None
+        self.retryable_errors = ()
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.history = ChannelHistoryCache()
+        self.context = ContextBuilder()
+        self.context_tokens_saved = 0
+        self.response_cache = None
+        self.outbound = outbound.attach(bot, self)
+        self.subscription = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+    async def cog_load(self):
+        state = hot_reload.claim(self.bot, self)
+        if state:
+            if self.response_cache:
+                await self.response_cache.close()
+            state["history"] = hot_reload.rebuild(ChannelHistoryCache, state["history"])
+            for name, value in state.items():
+                setattr(self, name, value)
+        elif self.response_cache:
+            await self.response_cache.load()
+        # Only channels with a history buffer, i.e. where /chat has been used,
+        # need their new messages.
+        self.subscription = message_pipeline.attach(self.bot).subscribe(
+            self.buffer_message, guilds=True, dms=True, channels=self.history)
+
+    async def cog_unload(self):
+        message_pipeline.attach(self.bot).unsubscribe(self.subscription)
+        if self.response_cache:
+            await self.response_cache.close()
+
+    async def cog_handoff(self):
+        # The semaphore is shared with the new instance so requests still in
+        # flight on this one keep counting towards the concurrency limit.
+        # The context builder only caches token counts and is rebuilt fresh.
+        state = {name: getattr(self, name) for name in
+                 ("client", "retryable_errors", "semaphore", "context_tokens_saved", "response_cache")}
+        state["history"] = hot_reload.export(self.history)
+        self.response_cache = None
+        return state
+
+    def load_client(self):
+        if self.client is not None:
+            return
+        from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, RateLimitError
+        # Retries are handled in create_completion so they can release the
+        # concurrency slot while backing off.
+        self.client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL,
+                                  timeout=REQUEST_TIMEOUT, max_retries=0)
+        self.retryable_errors = (RateLimitError, InternalServerError, APITimeoutError, APIConnectionError)
+
+    @contextlib.asynccontextmanager
+    async def request_slot(self):
+        self.queue_depth += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    async def create_completion(self, messages):
+        self.load_client()
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self.request_slot():
+                    with OPENAI_REQUEST_DURATION.time(kind="completion", status="error") as timer:
+                        completion = await self.client.chat.completions.create(model=MODEL, messages=messages)
+                        timer.labels["status"] = "ok"
+                        return completion
+            except self.retryable_errors as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self.retry_delay(e, attempt))
+
+    async def stream_completion(self, messages):
+        # Yields the reply as text deltas. A failed attempt is only retried if
+        # nothing has been yielded yet, so the caller never sees text twice.
+        self.load_client()
+        started = False
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self.request_slot():
+                    with OPENAI_REQUEST_DURATION.time(kind="stream", status="error") as timer:
+                        stream = await self.client.chat.completions.create(model=MODEL, messages=messages, stream=True)
+                        async for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                started = True
+                                yield chunk.choices[0].delta.content
+                        timer.labels["status"] = "ok"
+                    return
+            except self.retryable_errors as e:
+                if started or attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self.retry_delay(e, attempt))
+
+    @staticmethod
+    def retry_delay(error, attempt):
+        # Honour the server's Retry-After on 429s, otherwise use exponential
+        # backoff with full jitter so retries from many users spread out.
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
 
     @app_commands.command(name="chat", description="Chat with the AI")
     @app_commands.describe(
         message="Your message to the AI",
-        message_limit="Number of past messages to consider (default 20)"
+        message_limit="Number of past messages to consider (default 50)",
+        stream="Show the reply while it is being written (default true)"
     )
-    async def chat(self, interaction: discord.Interaction, message: str, message_limit: int = 50):
+    async def chat(self, interaction: discord.Interaction, message: str,
+                   message_limit: app_commands.Range[int, 0, MAX_MESSAGE_LIMIT] = 50, stream: bool = True):
         await interaction.response.defer(thinking=True)
 
-        past_messages = await self.get_past_messages(interaction.channel, limit=message_limit)
+        past_lines = await self.get_past_messages(interaction.channel, limit=message_limit)
+        past_messages, context_tokens, tokens_saved = self.context.build(past_lines)
+        self.context_tokens_saved += tokens_saved
+        logger.debug("Chat context: %d tokens used, %d saved", context_tokens, tokens_saved)
 
-        try:
-            chat_completion = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": SYSTEM_SETTINGS},
-                    {"role": "system", "content": f"Past messages:\n{past_messages}"},
-                    {"role": "user", "content": message}
-                ]
-            )
+        cache_key = None
+        if self.response_cache and interaction.channel.id not in self.response_cache.opted_out:
+            # Replies quote the channel's messages, so they are only reused in
+            # the same channel and with exactly the context that was sent.
+            cache_key = self.response_cache.key(message, interaction.channel.id,
+                                                fingerprint(CONTEXT_FINGERPRINT, past_messages))
+            cached_response = await self.response_cache.get(cache_key)
+            if cached_response is not None:
+                await self.send_long_message(interaction, cached_response)
+                return
 
-            ai_response = chat_completion.choices[0].message.content
+        try:
+            messages = [
+                {"role": "system", "content": SYSTEM_SETTINGS},
+                {"role": "system", "content": f"Past messages:\n{past_messages}"},
+                {"role": "user", "content": message}
+            ]
 
-            await self.send_long_message(interaction, ai_response)
+            if stream:
+                reply = StreamingReply(interaction)
+                deltas = []
+                async for delta in self.stream_completion(messages):
+                    deltas.append(delta)
+                    await reply.feed(delta)
+                await reply.flush()
+                ai_response = "".join(deltas)
+                if reply.message is None:
+                    # Nothing but whitespace arrived, e.g. the content filter
+                    # ended the stream; answer the deferred response anyway.
+                    await interaction.followup.send(EMPTY_RESPONSE)
+            else:
+                chat_completion = await self.create_completion(messages)
+                ai_response = chat_completion.choices[0].message.content
+                await self.send_long_message(interaction, ai_response if ai_response and ai_response.strip() else EMPTY_RESPONSE)
 
-            print(past_messages)
+            if cache_key and ai_response and ai_response.strip():
+                await self.response_cache.put(cache_key, ai_response)
         except Exception as e:
+            logger.exception("Error in chat command")
             error_message = f"An error occurred: {str(e)}"
             await interaction.followup.send(error_message)
 
+    @app_commands.command(name="chat_cache", description="Manage cached AI replies in this channel")
+    @app_commands.describe(
+        action="Choose 'on' or 'off' to allow or stop cached replies here, or 'stats' to see the cache hit rate"
+    )
+    @app_commands.default_permissions(manage_channels=True)
+    async def chat_cache(self, interaction: discord.Interaction, action: str):
+        if not self.response_cache:
+            await interaction.response.send_message("The reply cache is not enabled on this bot.", ephemeral=True)
+        elif action in ("on", "off"):
+            await self.response_cache.set_opt_out(interaction.channel.id, action == "off")
+            await interaction.response.send_message(f"Cached replies are now {action} in this channel.", ephemeral=True)
+        elif action == "stats":
+            cache = self.response_cache
+            await interaction.response.send_message(
+                f"Hits: {cache.hits}, misses: {cache.misses}, hit rate: {cache.hit_rate:.0%}", ephemeral=True)
+        else:
+            await interaction.response.send_message("Invalid action. Please use 'on', 'off' or 'stats'.", ephemeral=True)
+
     async def get_past_messages(self, channel, limit=50):
-        messages = []
-        async for message in channel.history(limit=limit):
-            if message.author == self.bot.user:
-                continue
-            formatted_message = f"{message.author.id} {message.author.name} {message.author.mention} @ {message.created_at.strftime('%Y-%m-%d %H:%M:%S')}: {message.content}"
-            messages.append(formatted_message)
-        return "\n".join(reversed(messages))
+        if limit <= 0:
+            return []
+        messages = self.history.recent(channel.id, limit)
+        if messages is None:
+            messages = await self.load_history(channel, limit)
+        return messages
+
+    async def load_history(self, channel, limit):
+        fetch_limit = max(limit, self.history.per_channel)
+        seeding = fetch_limit == self.history.per_channel
+        if seeding:
+            # Buffer messages that arrive while the history is fetched.
+            self.history.begin(channel.id)
+        entries = []
+        try:
+            async for message in channel.history(limit=fetch_limit):
+                line = None if message.author == self.bot.user else format_message(message)
+                entries.append((message.id, line))
+        except BaseException:
+            if seeding:
+                self.history.abort(channel.id)
+            raise
+        entries.reverse()
+        if limit <= 0:
+            return []
+        if seeding:
+            self.history.seed(channel.id, entries)
+            lines = self.history.recent(channel.id, limit)
+            if lines is not None:
+                return lines
+        return [line for _, line in entries[-limit:] if line is not None]
+
+    def buffer_message(self, message):
+        line = None if message.author == self.bot.user else format_message(message)
+        self.history.add(message.channel.id, message.id, line)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        if payload.channel_id in self.history and payload.message.author != self.bot.user:
+            self.history.edit(payload.channel_id, payload.message_id, format_message(payload.message))
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        self.history.delete(payload.channel_id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.history.delete(payload.channel_id, message_id)
 
     async def send_long_message(self, interaction, content):
         try:
-            if len(content) > 2000:
-                for i in range(0, len(content), 2000):
-                    chunk = content[i:i + 2000]
-                    await interaction.followup.send(chunk)
-            else:
-                await interaction.followup.send(content)
-        except Exception as e:
-            print(f"Error sending message: {str(e)}")
+            await asyncio.gather(*(self.outbound.send(interaction.followup, chunk)
+                                   for chunk in split_message(content)))
+        except Exception:
+            logger.exception("Error sending message")
 
 async def setup(bot):
     await bot.add_cog(ChatGPTCommands(bot))
\ No newline at end of file
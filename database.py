@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import DB_QUERY_DURATION, DB_QUERY_WAIT
+
+# Relative database paths are resolved against DATA_DIR, so every process
+# of a sharded deployment opens the same files whatever its working directory.
+DATA_DIR = os.getenv('DATA_DIR', '.')
+# Several processes may write to the same file. SQLite waits up to the busy
+# timeout for the write lock, and a call that still finds the database busy
+# is rolled back and retried with exponential backoff.
+BUSY_TIMEOUT_MS = 5000
+BUSY_RETRIES = 5
+BUSY_RETRY_DELAY = 0.05
+
+
+def is_busy(error):
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is None:
+        return 'locked' in str(error) or 'busy' in str(error)
+    return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def split_statements(script):
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+    if statement.strip():
+        yield statement
+
+
+class AsyncDatabase:
+    """A SQLite connection owned by a single dedicated thread.
+
+    Every query runs on that thread, so callers on the event loop only ever
+    await and the connection is never shared between threads.
+    """
+
+    def __init__(self, path):
+        self.name = path
+        self.path = os.path.join(DATA_DIR, path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-{path}")
+        self._conn = None
+        self._executor.submit(self._connect).result()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+
+    def _call(self, func, args, submitted):
+        started = time.perf_counter()
+        DB_QUERY_WAIT.observe(started - submitted, database=self.name)
+        status = "error"
+        try:
+            result = func(self._conn, *args)
+            status = "ok"
+            return result
+        except sqlite3.OperationalError as e:
+            if is_busy(e):
+                status = "busy"
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            raise
+        finally:
+            DB_QUERY_DURATION.observe(time.perf_counter() - started, database=self.name, status=status)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return await loop.run_in_executor(self._executor, self._call, func, args, time.perf_counter())
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or not is_busy(e):
+                    raise
+                await asyncio.sleep(BUSY_RETRY_DELAY * 2 ** attempt)
+
+    async def execute(self, sql, params=()):
+        def _execute(conn):
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        return await self.run(_execute)
+
+    async def executemany(self, sql, rows):
+        def _executemany(conn):
+            with conn:
+                conn.executemany(sql, rows)
+        return await self.run(_executemany)
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def run_reader(self, func, *args):
+        """Run ``func`` against its own read-only connection on a worker thread.
+
+        Long scans go through here so they never hold up the writer thread;
+        WAL mode lets them read while writes continue.
+        """
+        def _read():
+            started = time.perf_counter()
+            status = "error"
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                result = func(conn, *args)
+                status = "ok"
+                return result
+            finally:
+                conn.close()
+                DB_QUERY_DURATION.observe(time.perf_counter() - started, database=self.name, status=status)
+        return await asyncio.to_thread(_read)
+
+    async def migrate(self, migrations):
+        """Apply the scripts in ``migrations`` newer than the file's user_version.
+
+        ``migrations[0]`` upgrades a fresh file to version 1, ``migrations[1]``
+        to version 2 and so on. Each script runs in its own write transaction,
+        and the version is re-checked once the lock is held, so processes
+        starting together apply every migration exactly once.
+        """
+        def _migrate(conn):
+            for target, script in enumerate(migrations, start=1):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if conn.execute("PRAGMA user_version").fetchone()[0] < target:
+                        for statement in split_statements(script):
+                            conn.execute(statement)
+                        conn.execute(f"PRAGMA user_version = {target}")
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    raise
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        return await self.run(_migrate)
+
+    async def close(self):
+        await self.run(lambda conn: conn.close())
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,283 @@
+import csv
+import io
+import tempfile
+import zipfile
+from database import AsyncDatabase
+
+EXPORT_TABLES = {
+    "sleep": "sleep_entries",
+    "diet": "diet_entries",
+    "exercise": "exercise_entries",
+    "todo": "todo_entries",
+    "journal": "journal_entries",
+    "body": "body_tracking",
+}
+
+EXPORT_FORMATS = ["csv", "parquet"]
+EXPORT_BATCH_SIZE = 500
+# Archives stay in memory up to this size before spilling to disk.
+EXPORT_SPOOL_SIZE = 4 * 1024 * 1024
+
+# Entry tables carry a sortable "YYYY-MM-DD HH:MM:SS" recorded_at column,
+# indexed together with user_id, so per-user lookups never scan the table.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MIGRATIONS = [
+    # 1: original schema
+    '''
+    CREATE TABLE IF NOT EXISTS health_profiles
+        (user_id INTEGER PRIMARY KEY, is_public INTEGER);
+    CREATE TABLE IF NOT EXISTS sleep_entries
+        (id INTEGER PRIMARY KEY, user_id INTEGER, hours_slept REAL, score INTEGER,
+        description TEXT, bed_time TEXT, wake_time TEXT, date TEXT);
+    CREATE TABLE IF NOT EXISTS diet_entries
+        (id INTEGER PRIMARY KEY, user_id INTEGER, food TEXT, calories INTEGER,
+        protein REAL, fat REAL, carbs REAL, fiber REAL, date TEXT, time TEXT, description TEXT);
+    CREATE TABLE IF NOT EXISTS exercise_entries
+        (id INTEGER PRIMARY KEY, user_id INTEGER, name TEXT, reps INTEGER, sets INTEGER,
+        variation TEXT, cool_down TEXT, date TEXT);
+    CREATE TABLE IF NOT EXISTS todo_entries
+        (id INTEGER PRIMARY KEY, user_id INTEGER, task TEXT, date TEXT, completed INTEGER);
+    CREATE TABLE IF NOT EXISTS journal_entries
+        (id INTEGER PRIMARY KEY, user_id INTEGER, entry TEXT, date TEXT, time TEXT, mood INTEGER);
+    CREATE TABLE IF NOT EXISTS body_tracking
+        (id INTEGER PRIMARY KEY, user_id INTEGER, mass_in_kg REAL, height REAL,
+        age INTEGER, activity_level INTEGER, body_fat_percentage REAL,
+        time TEXT, date TEXT);
+    ''',
+    # 2: recorded_at timestamps and per-user indexes
+    '''
+    ALTER TABLE sleep_entries ADD COLUMN recorded_at TEXT;
+    ALTER TABLE diet_entries ADD COLUMN recorded_at TEXT;
+    ALTER TABLE exercise_entries ADD COLUMN recorded_at TEXT;
+    ALTER TABLE journal_entries ADD COLUMN recorded_at TEXT;
+    ALTER TABLE body_tracking ADD COLUMN recorded_at TEXT;
+    UPDATE sleep_entries SET recorded_at = date || ' 00:00:00';
+    UPDATE exercise_entries SET recorded_at = date || ' 00:00:00';
+    UPDATE diet_entries SET recorded_at = date || ' ' || COALESCE(time, '00:00') || ':00';
+    UPDATE journal_entries SET recorded_at = date || ' ' || COALESCE(time, '00:00') || ':00';
+    UPDATE body_tracking SET recorded_at = date || ' ' || COALESCE(time, '00:00') || ':00';
+    CREATE INDEX IF NOT EXISTS idx_sleep_user_recorded ON sleep_entries (user_id, recorded_at);
+    CREATE INDEX IF NOT EXISTS idx_diet_user_recorded ON diet_entries (user_id, recorded_at);
+    CREATE INDEX IF NOT EXISTS idx_exercise_user_recorded ON exercise_entries (user_id, recorded_at);
+    CREATE INDEX IF NOT EXISTS idx_journal_user_recorded ON journal_entries (user_id, recorded_at);
+    CREATE INDEX IF NOT EXISTS idx_body_user_recorded ON body_tracking (user_id, recorded_at);
+    CREATE INDEX IF NOT EXISTS idx_todo_user_date ON todo_entries (user_id, date);
+    ''',
+    # 3: per-user, per-category write counters for the chart cache
+    '''
+    CREATE TABLE IF NOT EXISTS data_versions
+        (user_id INTEGER, category TEXT, version INTEGER NOT NULL,
+        PRIMARY KEY (user_id, category));
+    ''',
+]
+
+# Committed together with each write, so every shard sees the new version.
+BUMP_VERSION = '''INSERT INTO data_versions (user_id, category, version) VALUES (?, ?, 1)
+                  ON CONFLICT (user_id, category) DO UPDATE SET version = version + 1'''
+
+CHART_QUERIES = {
+    "sleep": "SELECT date, hours_slept, score FROM sleep_entries WHERE user_id = ? AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at",
+    "diet": "SELECT date, calories FROM diet_entries WHERE user_id = ? AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at",
+    "exercise": "SELECT date, name, sets * reps AS total_reps FROM exercise_entries WHERE user_id = ? AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at",
+    "body": "SELECT date, mass_in_kg, body_fat_percentage FROM body_tracking WHERE user_id = ? AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at",
+}
+
+
+def day_bounds(start_date, end_date):
+    return start_date.strftime("%Y-%m-%d 00:00:00"), end_date.strftime("%Y-%m-%d 23:59:59")
+
+
+def _write_csv(stream, cursor):
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow([description[0] for description in cursor.description])
+    count = 0
+    while rows := cursor.fetchmany(EXPORT_BATCH_SIZE):
+        writer.writerows(rows)
+        count += len(rows)
+    text.flush()
+    text.detach()
+    return count
+
+
+def _write_parquet(stream, cursor, conn, table):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+    schema = pa.schema([(column[1], arrow_types.get(column[2].upper(), pa.string()))
+                        for column in conn.execute(f"PRAGMA table_info({table})")])
+    count = 0
+    with pq.ParquetWriter(stream, schema) as writer:
+        while rows := cursor.fetchmany(EXPORT_BATCH_SIZE):
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            count += len(rows)
+    return count
+
+
+def _export_archive(conn, user_id, data_types, file_format):
+    archive = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    total = 0
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for data_type in data_types:
+            table = EXPORT_TABLES[data_type]
+            cursor = conn.execute(f"SELECT * FROM {table} WHERE user_id = ? ORDER BY id", (user_id,))
+            with zf.open(f"{data_type}_data.{file_format}", "w") as stream:
+                if file_format == "parquet":
+                    total += _write_parquet(stream, cursor, conn, table)
+                else:
+                    total += _write_csv(stream, cursor)
+    archive.seek(0)
+    return archive, total
+
+
+class HealthStore(AsyncDatabase):
+    def __init__(self, path='health_data.db'):
+        super().__init__(path)
+
+    async def data_version(self, user_id, category):
+        # Changes whenever this user's rows in the category do, from any
+        # process, so cached charts for everyone else stay valid.
+        result = await self.fetchone("SELECT version FROM data_versions WHERE user_id = ? AND category = ?",
+                                     (user_id, category))
+        return result[0] if result else 0
+
+    async def _write(self, user_id, category, sql, params):
+        def _write(conn):
+            with conn:
+                conn.execute(sql, params)
+                conn.execute(BUMP_VERSION, (user_id, category))
+        await self.run(_write)
+
+    async def create_tables(self):
+        await self.migrate(MIGRATIONS)
+
+    # Profiles
+
+    async def set_profile_visibility(self, user_id, is_public):
+        await self.execute("INSERT OR REPLACE INTO health_profiles (user_id, is_public) VALUES (?, ?)", (user_id, int(is_public)))
+
+    async def is_profile_public(self, user_id):
+        result = await self.fetchone("SELECT is_public FROM health_profiles WHERE user_id = ?", (user_id,))
+        return bool(result and result[0])
+
+    async def latest_entries(self, user_id):
+        def _latest_entries(conn):
+            c = conn.cursor()
+            c.execute("SELECT * FROM sleep_entries WHERE user_id = ? ORDER BY recorded_at DESC LIMIT 1", (user_id,))
+            sleep_entry = c.fetchone()
+            c.execute("SELECT * FROM diet_entries WHERE user_id = ? ORDER BY recorded_at DESC LIMIT 1", (user_id,))
+            diet_entry = c.fetchone()
+            c.execute("SELECT * FROM exercise_entries WHERE user_id = ? ORDER BY recorded_at DESC LIMIT 1", (user_id,))
+            exercise_entry = c.fetchone()
+            return {"sleep": sleep_entry, "diet": diet_entry, "exercise": exercise_entry}
+        return await self.run(_latest_entries)
+
+    # Tracking entries
+
+    async def add_sleep_entry(self, user_id, hours_slept, score, description, bed_time, wake_time, recorded_at):
+        await self._write(user_id, "sleep", '''INSERT INTO sleep_entries
+                              (user_id, hours_slept, score, description, bed_time, wake_time, date, recorded_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (user_id, hours_slept, score, description, bed_time, wake_time,
+                            recorded_at.strftime("%Y-%m-%d"), recorded_at.strftime(TIMESTAMP_FORMAT)))
+
+    async def add_diet_entry(self, user_id, food, calories, protein, fat, carbs, fiber, recorded_at):
+        await self._write(user_id, "diet", '''INSERT INTO diet_entries
+                              (user_id, food, calories, protein, fat, carbs, fiber, date, time, recorded_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (user_id, food, calories, protein, fat, carbs, fiber, recorded_at.strftime("%Y-%m-%d"),
+                            recorded_at.strftime("%H:%M"), recorded_at.strftime(TIMESTAMP_FORMAT)))
+
+    async def add_exercise_entry(self, user_id, name, reps, sets, variation, cool_down, recorded_at):
+        await self._write(user_id, "exercise", '''INSERT INTO exercise_entries
+                              (user_id, name, reps, sets, variation, cool_down, date, recorded_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (user_id, name, reps, sets, variation, cool_down,
+                            recorded_at.strftime("%Y-%m-%d"), recorded_at.strftime(TIMESTAMP_FORMAT)))
+
+    async def add_journal_entry(self, user_id, entry, mood, recorded_at):
+        await self._write(user_id, "journal", '''INSERT INTO journal_entries
+                              (user_id, entry, date, time, mood, recorded_at)
+                              VALUES (?, ?, ?, ?, ?, ?)''',
+                           (user_id, entry, recorded_at.strftime("%Y-%m-%d"), recorded_at.strftime("%H:%M"),
+                            mood, recorded_at.strftime(TIMESTAMP_FORMAT)))
+
+    async def add_body_entry(self, user_id, mass_in_kg, height, age, activity_level, body_fat_percentage, recorded_at):
+        await self._write(user_id, "body", '''INSERT INTO body_tracking
+                              (user_id, mass_in_kg, height, age, activity_level, body_fat_percentage, time, date, recorded_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (user_id, mass_in_kg, height, age, activity_level, body_fat_percentage,
+                            recorded_at.strftime("%H:%M"), recorded_at.strftime("%Y-%m-%d"),
+                            recorded_at.strftime(TIMESTAMP_FORMAT)))
+
+    # Todos
+
+    async def todos(self, user_id, date):
+        return await self.fetchall("SELECT task, completed FROM todo_entries WHERE user_id = ? AND date = ? ORDER BY id", (user_id, date))
+
+    async def add_todo(self, user_id, task, date):
+        await self._write(user_id, "todo", '''INSERT INTO todo_entries
+                              (user_id, task, date, completed)
+                              VALUES (?, ?, ?, ?)''',
+                           (user_id, task, date, 0))
+
+    async def remove_todo(self, user_id, date, task_index):
+        def _remove_todo(conn):
+            task_id = self._todo_id(conn, user_id, date, task_index)
+            if task_id is None:
+                return False
+            with conn:
+                conn.execute("DELETE FROM todo_entries WHERE id = ?", (task_id,))
+                conn.execute(BUMP_VERSION, (user_id, "todo"))
+            return True
+        return await self.run(_remove_todo)
+
+    async def edit_todo(self, user_id, date, task_index, task):
+        def _edit_todo(conn):
+            task_id = self._todo_id(conn, user_id, date, task_index)
+            if task_id is None:
+                return False
+            with conn:
+                conn.execute("UPDATE todo_entries SET task = ? WHERE id = ?", (task, task_id))
+                conn.execute(BUMP_VERSION, (user_id, "todo"))
+            return True
+        return await self.run(_edit_todo)
+
+    @staticmethod
+    def _todo_id(conn, user_id, date, task_index):
+        tasks = conn.execute("SELECT id FROM todo_entries WHERE user_id = ? AND date = ? ORDER BY id",
+                             (user_id, date)).fetchall()
+        if 0 <= task_index < len(tasks):
+            return tasks[task_index][0]
+        return None
+
+    # Journal
+
+    async def latest_journal_date(self, user_id):
+        result = await self.fetchone("SELECT date FROM journal_entries WHERE user_id = ? ORDER BY recorded_at DESC LIMIT 1", (user_id,))
+        return result[0] if result else None
+
+    async def journal_entry(self, user_id, date):
+        return await self.fetchone("SELECT entry, time, mood FROM journal_entries WHERE user_id = ? AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at DESC LIMIT 1",
+                                   (user_id, f"{date} 00:00:00", f"{date} 23:59:59"))
+
+    # Body
+
+    async def latest_body_entry(self, user_id):
+        return await self.fetchone("SELECT mass_in_kg, height, age, activity_level, body_fat_percentage FROM body_tracking WHERE user_id = ? ORDER BY recorded_at DESC LIMIT 1",
+                                   (user_id,))
+
+    # Export and charts
+
+    async def export_archive(self, user_id, data_types, file_format="csv"):
+        """Stream the user's rows for ``data_types`` into one zip archive.
+
+        Returns the rewound archive file and the number of rows written.
+        """
+        return await self.run_reader(_export_archive, user_id, data_types, file_format)
+
+    async def chart_rows(self, user_id, data_type, start_date, end_date):
+        return await self.fetchall(CHART_QUERIES[data_type], (user_id, *day_bounds(start_date, end_date)))
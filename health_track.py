@@ -1,37 +1,50 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import sqlite3
+import io
 from datetime import datetime, timedelta
+import os
+from charts import ChartCache, ChartQueueFull, ChartRenderFailed, ChartRenderer
+from health_storage import EXPORT_FORMATS, EXPORT_TABLES, HealthStore
+import hot_reload
+import outbound
 
 class HealthTrackingCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.conn = sqlite3.connect('health_data.db')
-        self.create_tables()
-
-    def create_tables(self):
-        c = self.conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS health_profiles
-                     (user_id INTEGER PRIMARY KEY, is_public INTEGER)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS sleep_entries
-                     (id INTEGER PRIMARY KEY, user_id INTEGER, hours_slept REAL, score INTEGER, 
-                     description TEXT, bed_time TEXT, wake_time TEXT, date TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS diet_entries
-                     (id INTEGER PRIMARY KEY, user_id INTEGER, food TEXT, calories INTEGER, 
-                     protein REAL, fat REAL, carbs REAL, fiber REAL, date TEXT, time TEXT, description TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS exercise_entries
-                     (id INTEGER PRIMARY KEY, user_id INTEGER, name TEXT, reps INTEGER, sets INTEGER, 
-                     variation TEXT, cool_down TEXT, date TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS todo_entries
-                     (id INTEGER PRIMARY KEY, user_id INTEGER, task TEXT, date TEXT, completed INTEGER)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS journal_entries
-                     (id INTEGER PRIMARY KEY, user_id INTEGER, entry TEXT, date TEXT, time TEXT, mood INTEGER)''')
-         c.execute('''CREATE TABLE IF NOT EXISTS body_tracking
-                     (id INTEGER PRIMARY KEY, user_id INTEGER, mass_in_kg REAL, height REAL, 
-                     age INTEGER, activity_level INTEGER, body_fat_percentage REAL, 
-                     time TEXT, date TEXT)''')
-        self.conn.commit()
+        self.store = HealthStore()
+        self.charts = ChartRenderer(
+            workers=int(os.getenv('CHART_WORKERS', 2)),
+            queue_depth=int(os.getenv('CHART_QUEUE_DEPTH', 16))
+        )
+        self.chart_cache = ChartCache(
+            max_entries=int(os.getenv('CHART_CACHE_ENTRIES', 256)),
+            max_bytes=int(os.getenv('CHART_CACHE_BYTES', 32 * 1024 * 1024))
+        )
+        self.outbound = outbound.attach(bot, self)
+
+    async def cog_load(self):
+        state = hot_reload.claim(self.bot, self)
+        if state:
+            self.charts.close()
+            await self.store.close()
+            self.store = state["store"]
+            self.charts = state["charts"]
+            self.chart_cache = state["chart_cache"]
+            return
+        await self.store.create_tables()
+
+    async def cog_unload(self):
+        if self.charts is not None:
+            self.charts.close()
+        if self.store is not None:
+            await self.store.close()
+
+    async def cog_handoff(self):
+        state = {"store": self.store, "charts": self.charts, "chart_cache": self.chart_cache}
+        self.store = None
+        self.charts = None
+        return state
 
     @app_commands.command(name="health_profile", description="Set or view health profile")
     @app_commands.describe(
@@ -44,16 +57,11 @@ class HealthTrackingCog(commands.Cog):
             if is_public is None:
                 await interaction.response.send_message("Please specify whether your profile should be public or private.")
                 return
-            c = self.conn.cursor()
-            c.execute("INSERT OR REPLACE INTO health_profiles (user_id, is_public) VALUES (?, ?)", (interaction.user.id, int(is_public)))
-            self.conn.commit()
+            await self.store.set_profile_visibility(interaction.user.id, is_public)
             await interaction.response.send_message(f"Your health profile has been set to {'public' if is_public else 'private'}.")
         elif action == "view":
             if user and user != interaction.user:
-                c = self.conn.cursor()
-                c.execute("SELECT is_public FROM health_profiles WHERE user_id = ?", (user.id,))
-                result = c.fetchone()
-                if not result or not result[0]:
+                if not await self.store.is_profile_public(user.id):
                     await interaction.response.send_message("This user's health profile is private or doesn't exist.")
                     return
             target_user = user or interaction.user
@@ -62,17 +70,11 @@ class HealthTrackingCog(commands.Cog):
             await interaction.response.send_message("Invalid action. Please use 'set' or 'view'.")
 
     async def show_health_profile(self, interaction: discord.Interaction, user: discord.Member):
-        c = self.conn.cursor()
-        
         # Fetch the latest entries for each category
-        c.execute("SELECT * FROM sleep_entries WHERE user_id = ? ORDER BY date DESC LIMIT 1", (user.id,))
-        sleep_entry = c.fetchone()
-        
-        c.execute("SELECT * FROM diet_entries WHERE user_id = ? ORDER BY date DESC, time DESC LIMIT 1", (user.id,))
-        diet_entry = c.fetchone()
-        
-        c.execute("SELECT * FROM exercise_entries WHERE user_id = ? ORDER BY date DESC LIMIT 1", (user.id,))
-        exercise_entry = c.fetchone()
+        latest = await self.store.latest_entries(user.id)
+        sleep_entry = latest["sleep"]
+        diet_entry = latest["diet"]
+        exercise_entry = latest["exercise"]
         
         embed = discord.Embed(title=f"Health Profile for {user.display_name}", color=discord.Color.green())
         
@@ -89,17 +91,17 @@ class HealthTrackingCog(commands.Cog):
 
     @app_commands.command(name="sleep_track", description="Track your sleep")
     async def sleep_track(self, interaction: discord.Interaction):
-        modal = SleepTrackingModal()
+        modal = SleepTrackingModal(self.store)
         await interaction.response.send_modal(modal)
 
     @app_commands.command(name="diet_track", description="Track your diet")
     async def diet_track(self, interaction: discord.Interaction):
-        modal = DietTrackingModal()
+        modal = DietTrackingModal(self.store)
         await interaction.response.send_modal(modal)
 
     @app_commands.command(name="exercise_track", description="Track your exercise")
     async def exercise_track(self, interaction: discord.Interaction):
-        modal = ExerciseTrackingModal()
+        modal = ExerciseTrackingModal(self.store)
         await interaction.response.send_modal(modal)
 
     @app_commands.command(name="todo", description="Manage your todo list")
@@ -111,22 +113,20 @@ class HealthTrackingCog(commands.Cog):
         if action == "view":
             await self.view_todo(interaction, date)
         elif action == "add":
-            modal = TodoAddModal(date)
+            modal = TodoAddModal(self.store, date)
             await interaction.response.send_modal(modal)
         elif action == "remove":
-            modal = TodoRemoveModal(date)
+            modal = TodoRemoveModal(self.store, date)
             await interaction.response.send_modal(modal)
         elif action == "edit":
-            modal = TodoEditModal(date)
+            modal = TodoEditModal(self.store, date)
             await interaction.response.send_modal(modal)
         else:
             await interaction.response.send_message("Invalid action. Please use 'view', 'add', 'remove', or 'edit'.")
 
     async def view_todo(self, interaction: discord.Interaction, date: str):
         target_date = self.parse_date(date)
-        c = self.conn.cursor()
-        c.execute("SELECT task, completed FROM todo_entries WHERE user_id = ? AND date = ? ORDER BY id", (interaction.user.id, target_date.strftime("%Y-%m-%d")))
-        todos = c.fetchall()
+        todos = await self.store.todos(interaction.user.id, target_date.strftime("%Y-%m-%d"))
 
         if not todos:
             await interaction.response.send_message(f"No todos found for {target_date.strftime('%d/%m/%Y')}.")
@@ -146,24 +146,18 @@ class HealthTrackingCog(commands.Cog):
     )
     async def journal(self, interaction: discord.Interaction, action: str, date: str = None):
         if action == "entry":
-            modal = JournalEntryModal()
+            modal = JournalEntryModal(self.store)
             await interaction.response.send_modal(modal)
         elif action == "view":
             if date:
                 target_date = datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d")
             else:
-                c = self.conn.cursor()
-                c.execute("SELECT date FROM journal_entries WHERE user_id = ? ORDER BY date DESC, time DESC LIMIT 1", (interaction.user.id,))
-                result = c.fetchone()
-                if result:
-                    target_date = result[0]
-                else:
+                target_date = await self.store.latest_journal_date(interaction.user.id)
+                if not target_date:
                     await interaction.response.send_message("No journal entries found.")
                     return
 
-            c = self.conn.cursor()
-            c.execute("SELECT entry, time, mood FROM journal_entries WHERE user_id = ? AND date = ? ORDER BY time DESC LIMIT 1", (interaction.user.id, target_date))
-            entry = c.fetchone()
+            entry = await self.store.journal_entry(interaction.user.id, target_date)
 
             if entry:
                 embed = discord.Embed(title=f"Journal Entry for {datetime.strptime(target_date, '%Y-%m-%d').strftime('%d/%m/%Y')}", color=discord.Color.purple())
@@ -176,54 +170,46 @@ class HealthTrackingCog(commands.Cog):
         else:
             await interaction.response.send_message("Invalid action. Please use 'entry' or 'view'.")
 
-		@app_commands.command(name="body_track", description="Track your body measurements")
+    @app_commands.command(name="body_track", description="Track your body measurements")
     async def body_track(self, interaction: discord.Interaction):
-        modal = BodyTrackingModal()
+        modal = BodyTrackingModal(self.store)
         await interaction.response.send_modal(modal)
 
-    @app_commands.command(name="export_data", description="Export your health data as CSV")
+    @app_commands.command(name="export_data", description="Export your health data as CSV or Parquet")
     @app_commands.describe(
-        data_type="Choose the type of data to export (sleep, diet, exercise, todo, journal, body)"
+        data_type="Choose the type of data to export (sleep, diet, exercise, todo, journal, body, all)",
+        file_format="Choose the file format (csv or parquet, default: csv)"
     )
-    async def export_data(self, interaction: discord.Interaction, data_type: str):
+    async def export_data(self, interaction: discord.Interaction, data_type: str, file_format: str = "csv"):
         await interaction.response.defer(ephemeral=True)
         
-        if data_type not in ["sleep", "diet", "exercise", "todo", "journal", "body"]:
-            await interaction.followup.send("Invalid data type. Please choose from sleep, diet, exercise, todo, journal, or body.")
+        if data_type != "all" and data_type not in EXPORT_TABLES:
+            await interaction.followup.send("Invalid data type. Please choose from sleep, diet, exercise, todo, journal, body, or all.")
             return
 
-        c = self.conn.cursor()
-        if data_type == "sleep":
-            c.execute("SELECT * FROM sleep_entries WHERE user_id = ?", (interaction.user.id,))
-        elif data_type == "diet":
-            c.execute("SELECT * FROM diet_entries WHERE user_id = ?", (interaction.user.id,))
-        elif data_type == "exercise":
-            c.execute("SELECT * FROM exercise_entries WHERE user_id = ?", (interaction.user.id,))
-        elif data_type == "todo":
-            c.execute("SELECT * FROM todo_entries WHERE user_id = ?", (interaction.user.id,))
-        elif data_type == "journal":
-            c.execute("SELECT * FROM journal_entries WHERE user_id = ?", (interaction.user.id,))
-        elif data_type == "body":
-            c.execute("SELECT * FROM body_tracking WHERE user_id = ?", (interaction.user.id,))
-
-        rows = c.fetchall()
-        if not rows:
-            await interaction.followup.send(f"No {data_type} data found to export.")
+        if file_format not in EXPORT_FORMATS:
+            await interaction.followup.send("Invalid file format. Please choose csv or parquet.")
             return
 
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([description[0] for description in c.description])  # Write headers
-        writer.writerows(rows)
-
-        output.seek(0)
-        file = discord.File(fp=output, filename=f"{data_type}_data.csv")
-        
+        data_types = list(EXPORT_TABLES) if data_type == "all" else [data_type]
         try:
-            await interaction.user.send(f"Here's your exported {data_type} data:", file=file)
-            await interaction.followup.send(f"Your {data_type} data has been sent to your DMs.")
-        except discord.errors.Forbidden:
-            await interaction.followup.send("I couldn't send you a DM. Please make sure your DM settings allow messages from server members.")
+            archive, row_count = await self.store.export_archive(interaction.user.id, data_types, file_format)
+        except ImportError:
+            await interaction.followup.send("Parquet export is not available right now. Please use csv instead.")
+            return
+
+        with archive:
+            if not row_count:
+                await interaction.followup.send(f"No {'health' if data_type == 'all' else data_type} data found to export.")
+                return
+
+            file = discord.File(fp=archive, filename=f"{data_type}_data.zip")
+            
+            try:
+                await self.outbound.send(interaction.user, f"Here's your exported {data_type} data:", file=file)
+                await interaction.followup.send(f"Your {data_type} data has been sent to your DMs.")
+            except discord.errors.Forbidden:
+                await interaction.followup.send("I couldn't send you a DM. Please make sure your DM settings allow messages from server members.")
 
     @app_commands.command(name="visualize_data", description="Visualize your health data")
     @app_commands.describe(
@@ -237,79 +223,32 @@ class HealthTrackingCog(commands.Cog):
             await interaction.followup.send("Invalid data type. Please choose from sleep, diet, exercise, or body.")
             return
 
-        c = self.conn.cursor()
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
+        # The date is part of the key because the chart window moves with it.
+        cache_key = (interaction.user.id, data_type, days,
+                     await self.store.data_version(interaction.user.id, data_type), end_date.date())
+        png = self.chart_cache.get(cache_key)
+
+        if png is None:
+            rows = await self.store.chart_rows(interaction.user.id, data_type, start_date, end_date)
+            try:
+                png = await self.charts.render(data_type, rows)
+            except ChartQueueFull:
+                await interaction.followup.send("Too many charts are being drawn right now. Please try again in a moment.")
+                return
+            except ChartRenderFailed:
+                await interaction.followup.send("Drawing the chart failed. Please try again.")
+                return
+            self.chart_cache.put(cache_key, png)
 
-        if data_type == "sleep":
-            c.execute("SELECT date, hours_slept, score FROM sleep_entries WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
-                      (interaction.user.id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
-            df = pd.DataFrame(c.fetchall(), columns=["date", "hours_slept", "score"])
-            df['date'] = pd.to_datetime(df['date'])
-            
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
-            sns.lineplot(data=df, x="date", y="hours_slept", ax=ax1)
-            ax1.set_title("Sleep Duration Over Time")
-            ax1.set_ylabel("Hours Slept")
-            
-            sns.lineplot(data=df, x="date", y="score", ax=ax2)
-            ax2.set_title("Sleep Quality Score Over Time")
-            ax2.set_ylabel("Score")
-
-        elif data_type == "diet":
-            c.execute("SELECT date, calories FROM diet_entries WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
-                      (interaction.user.id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
-            df = pd.DataFrame(c.fetchall(), columns=["date", "calories"])
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.groupby("date").sum().reset_index()
-            
-            fig, ax = plt.subplots(figsize=(10, 6))
-            sns.barplot(data=df, x="date", y="calories", ax=ax)
-            ax.set_title("Daily Calorie Intake")
-            ax.set_ylabel("Calories")
-            plt.xticks(rotation=45)
-
-        elif data_type == "exercise":
-            c.execute("SELECT date, name, sets * reps AS total_reps FROM exercise_entries WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
-                      (interaction.user.id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
-            df = pd.DataFrame(c.fetchall(), columns=["date", "exercise", "total_reps"])
-            df['date'] = pd.to_datetime(df['date'])
-            
-            fig, ax = plt.subplots(figsize=(12, 6))
-            sns.scatterplot(data=df, x="date", y="total_reps", hue="exercise", size="total_reps", sizes=(20, 200), ax=ax)
-            ax.set_title("Exercise Progress Over Time")
-            ax.set_ylabel("Total Reps")
-            plt.xticks(rotation=45)
-
-        elif data_type == "body":
-            c.execute("SELECT date, mass_in_kg, body_fat_percentage FROM body_tracking WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
-                      (interaction.user.id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
-            df = pd.DataFrame(c.fetchall(), columns=["date", "mass_in_kg", "body_fat_percentage"])
-            df['date'] = pd.to_datetime(df['date'])
-            
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
-            sns.lineplot(data=df, x="date", y="mass_in_kg", ax=ax1)
-            ax1.set_title("Body Mass Over Time")
-            ax1.set_ylabel("Mass (kg)")
-            
-            sns.lineplot(data=df, x="date", y="body_fat_percentage", ax=ax2)
-            ax2.set_title("Body Fat Percentage Over Time")
-            ax2.set_ylabel("Body Fat %")
-
-        plt.tight_layout()
-        img_stream = io.BytesIO()
-        plt.savefig(img_stream, format='png')
-        img_stream.seek(0)
-        file = discord.File(fp=img_stream, filename="visualization.png")
+        file = discord.File(fp=io.BytesIO(png), filename="visualization.png")
         
         await interaction.followup.send(f"Here's your {data_type} data visualization:", file=file)
 
     @app_commands.command(name="calculate_tdee", description="Calculate your Total Daily Energy Expenditure")
     async def calculate_tdee(self, interaction: discord.Interaction):
-        c = self.conn.cursor()
-        c.execute("SELECT mass_in_kg, height, age, activity_level, body_fat_percentage FROM body_tracking WHERE user_id = ? ORDER BY date DESC LIMIT 1",
-                  (interaction.user.id,))
-        result = c.fetchone()
+        result = await self.store.latest_body_entry(interaction.user.id)
 
         if not result:
             await interaction.response.send_message("Please track your body measurements first using the /body_track command.")
@@ -360,17 +299,15 @@ class SleepTrackingModal(discord.ui.Modal, title="Sleep Tracking"):
     bed_time = discord.ui.TextInput(label="Bed Time", placeholder="e.g., 22:30")
     wake_time = discord.ui.TextInput(label="Wake Time", placeholder="e.g., 06:30")
 
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO sleep_entries 
-                     (user_id, hours_slept, score, description, bed_time, wake_time, date) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (interaction.user.id, float(self.hours_slept.value), int(self.score.value),
-                   self.description.value, self.bed_time.value, self.wake_time.value, 
-                   datetime.now().strftime("%Y-%m-%d")))
-        conn.commit()
-        conn.close()
+        await self.store.add_sleep_entry(
+            interaction.user.id, float(self.hours_slept.value), int(self.score.value),
+            self.description.value, self.bed_time.value, self.wake_time.value,
+            datetime.now())
         await interaction.response.send_message("Sleep data recorded successfully!", ephemeral=True)
 
 class DietTrackingModal(discord.ui.Modal, title="Diet Tracking"):
@@ -380,17 +317,15 @@ class DietTrackingModal(discord.ui.Modal, title="Diet Tracking"):
     fat = discord.ui.TextInput(label="Fat (g)")
     carbs = discord.ui.TextInput(label="Carbs (g)")
 
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO diet_entries 
-                     (user_id, food, calories, protein, fat, carbs, fiber, date, time) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (interaction.user.id, self.food.value, int(self.calories.value),
-                   float(self.protein.value), float(self.fat.value), float(self.carbs.value),
-                   0, datetime.now().strftime("%Y-%m-%d"), datetime.now().strftime("%H:%M")))
-        conn.commit()
-        conn.close()
+        await self.store.add_diet_entry(
+            interaction.user.id, self.food.value, int(self.calories.value),
+            float(self.protein.value), float(self.fat.value), float(self.carbs.value),
+            0, datetime.now())
         await interaction.response.send_message("Diet data recorded successfully!", ephemeral=True)
 
 class ExerciseTrackingModal(discord.ui.Modal, title="Exercise Tracking"):
@@ -400,112 +335,84 @@ class ExerciseTrackingModal(discord.ui.Modal, title="Exercise Tracking"):
     variation = discord.ui.TextInput(label="Variation/Weights")
     cool_down = discord.ui.TextInput(label="Cool Down", required=False)
 
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO exercise_entries 
-                     (user_id, name, reps, sets, variation, cool_down, date) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (interaction.user.id, self.name.value, int(self.reps.value),
-                   int(self.sets.value), self.variation.value, self.cool_down.value,
-                   datetime.now().strftime("%Y-%m-%d")))
-        conn.commit()
-        conn.close()
+        await self.store.add_exercise_entry(
+            interaction.user.id, self.name.value, int(self.reps.value),
+            int(self.sets.value), self.variation.value, self.cool_down.value,
+            datetime.now())
         await interaction.response.send_message("Exercise data recorded successfully!", ephemeral=True)
 
 class TodoAddModal(discord.ui.Modal, title="Add Todo"):
     task = discord.ui.TextInput(label="Task")
 
-    def __init__(self, date):
+    def __init__(self, store, date):
         super().__init__()
+        self.store = store
         self.date = date
 
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
         target_date = HealthTrackingCog.parse_date(self, self.date).strftime("%Y-%m-%d")
-        c.execute('''INSERT INTO todo_entries 
-                     (user_id, task, date, completed) 
-                     VALUES (?, ?, ?, ?)''',
-                  (interaction.user.id, self.task.value, target_date, 0))
-        conn.commit()
-        conn.close()
+        await self.store.add_todo(interaction.user.id, self.task.value, target_date)
         await interaction.response.send_message(f"Todo added for {target_date}!", ephemeral=True)
 
 class TodoRemoveModal(discord.ui.Modal, title="Remove Todo"):
     task_number = discord.ui.TextInput(label="Task Number to Remove")
 
-    def __init__(self, date):
+    def __init__(self, store, date):
         super().__init__()
+        self.store = store
         self.date = date
 
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
         target_date = HealthTrackingCog.parse_date(self, self.date).strftime("%Y-%m-%d")
-        c.execute("SELECT id FROM todo_entries WHERE user_id = ? AND date = ? ORDER BY id", 
-                  (interaction.user.id, target_date))
-        tasks = c.fetchall()
-        
         try:
             task_index = int(self.task_number.value) - 1
-            if 0 <= task_index < len(tasks):
-                task_id = tasks[task_index][0]
-                c.execute("DELETE FROM todo_entries WHERE id = ?", (task_id,))
-                conn.commit()
-                await interaction.response.send_message(f"Todo removed for {target_date}!", ephemeral=True)
-            else:
-                await interaction.response.send_message("Invalid task number.", ephemeral=True)
         except ValueError:
             await interaction.response.send_message("Please enter a valid number.", ephemeral=True)
-        finally:
-            conn.close()
+            return
+
+        if await self.store.remove_todo(interaction.user.id, target_date, task_index):
+            await interaction.response.send_message(f"Todo removed for {target_date}!", ephemeral=True)
+        else:
+            await interaction.response.send_message("Invalid task number.", ephemeral=True)
 
 class TodoEditModal(discord.ui.Modal, title="Edit Todo"):
     task_number = discord.ui.TextInput(label="Task Number to Edit")
     new_task = discord.ui.TextInput(label="New Task Description")
 
-    def __init__(self, date):
+    def __init__(self, store, date):
         super().__init__()
+        self.store = store
         self.date = date
 
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
         target_date = HealthTrackingCog.parse_date(self, self.date).strftime("%Y-%m-%d")
-        c.execute("SELECT id FROM todo_entries WHERE user_id = ? AND date = ? ORDER BY id", 
-                  (interaction.user.id, target_date))
-        tasks = c.fetchall()
-        
         try:
             task_index = int(self.task_number.value) - 1
-            if 0 <= task_index < len(tasks):
-                task_id = tasks[task_index][0]
-                c.execute("UPDATE todo_entries SET task = ? WHERE id = ?", (self.new_task.value, task_id))
-                conn.commit()
-                await interaction.response.send_message(f"Todo updated for {target_date}!", ephemeral=True)
-            else:
-                await interaction.response.send_message("Invalid task number.", ephemeral=True)
         except ValueError:
             await interaction.response.send_message("Please enter a valid number.", ephemeral=True)
-        finally:
-            conn.close()
+            return
+
+        if await self.store.edit_todo(interaction.user.id, target_date, task_index, self.new_task.value):
+            await interaction.response.send_message(f"Todo updated for {target_date}!", ephemeral=True)
+        else:
+            await interaction.response.send_message("Invalid task number.", ephemeral=True)
 
 class JournalEntryModal(discord.ui.Modal, title="Journal Entry"):
     entry = discord.ui.TextInput(label="Journal Entry", style=discord.TextStyle.long)
     mood = discord.ui.TextInput(label="Mood (1-5)")
 
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
-        now = datetime.now()
-        c.execute('''INSERT INTO journal_entries 
-                     (user_id, entry, date, time, mood) 
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (interaction.user.id, self.entry.value, now.strftime("%Y-%m-%d"),
-                   now.strftime("%H:%M"), int(self.mood.value)))
-        conn.commit()
-        conn.close()
+        await self.store.add_journal_entry(
+            interaction.user.id, self.entry.value, int(self.mood.value), datetime.now())
         await interaction.response.send_message("Journal entry recorded successfully!", ephemeral=True)
 
 class BodyTrackingModal(discord.ui.Modal, title="Body Tracking"):
@@ -515,18 +422,15 @@ class BodyTrackingModal(discord.ui.Modal, title="Body Tracking"):
     activity_level = discord.ui.TextInput(label="Activity Level (1-5)")
     body_fat = discord.ui.TextInput(label="Body Fat Percentage")
 
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
     async def on_submit(self, interaction: discord.Interaction):
-        conn = sqlite3.connect('health_data.db')
-        c = conn.cursor()
-        now = datetime.now()
-        c.execute('''INSERT INTO body_tracking 
-                     (user_id, mass_in_kg, height, age, activity_level, body_fat_percentage, time, date) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (interaction.user.id, float(self.mass.value), float(self.height.value),
-                   int(self.age.value), int(self.activity_level.value), float(self.body_fat.value),
-                   now.strftime("%H:%M"), now.strftime("%Y-%m-%d")))
-        conn.commit()
-        conn.close()
+        await self.store.add_body_entry(
+            interaction.user.id, float(self.mass.value), float(self.height.value),
+            int(self.age.value), int(self.activity_level.value), float(self.body_fat.value),
+            datetime.now())
         await interaction.response.send_message("Body tracking data recorded successfully!", ephemeral=True)
 
 async def setup(bot):
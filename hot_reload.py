@@ -0,0 +1,137 @@
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+WATCH_FILES = os.getenv('HOT_RELOAD_WATCH', 'false').lower() in ('1', 'true', 'yes')
+WATCH_INTERVAL = float(os.getenv('HOT_RELOAD_INTERVAL', 2.0))
+
+
+def export(obj):
+    """The attributes of ``obj``, for handing over an instance of a class
+    defined in the extension being reloaded."""
+    slots = getattr(type(obj), '__slots__', None)
+    if slots is not None:
+        return {name: getattr(obj, name) for name in slots if hasattr(obj, name)}
+    return dict(vars(obj))
+
+
+def rebuild(cls, attributes):
+    """An instance of the reloaded module's ``cls`` carrying ``attributes``.
+
+    ``__init__`` is not called, so the new class must keep the attribute
+    layout of the old one; a cog whose state classes change shape needs a
+    restart, or has to translate the attributes itself.
+    """
+    obj = cls.__new__(cls)
+    for name, value in attributes.items():
+        setattr(obj, name, value)
+    return obj
+
+
+def stash(bot, cog, state):
+    if not hasattr(bot, 'handoff'):
+        bot.handoff = {}
+    bot.handoff[cog.qualified_name] = state
+
+
+def claim(bot, cog):
+    """Return the state the previous instance of ``cog`` handed over, if any.
+
+    Cogs call this from cog_load. Anything they adopt must be left open by
+    the old instance, which is why cog_handoff runs before cog_unload.
+    """
+    return getattr(bot, 'handoff', {}).pop(cog.qualified_name, None)
+
+
+class HotReload(commands.Cog):
+    """Reloads single extensions in place without reconnecting to the gateway.
+
+    Before an extension is reloaded, each of its cogs that defines
+    ``cog_handoff`` is asked for its in-memory state, which the new instance
+    picks up with ``claim`` in its cog_load. Only the extension module itself
+    is re-imported; helper modules it imports keep their loaded code.
+
+    Handed-over state must not hold instances of classes from the reloaded
+    module, or the new cog would keep running their old methods. Such
+    objects are passed through ``export`` and ``rebuild`` so they come back
+    as instances of the new classes.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.mtimes = {}
+
+    async def cog_load(self):
+        if WATCH_FILES:
+            self.mtimes = {extension: self.mtime(extension) for extension in self.bot.extensions}
+            self.watch.start()
+
+    async def cog_unload(self):
+        self.watch.cancel()
+
+    @staticmethod
+    def mtime(extension):
+        try:
+            return os.stat(sys.modules[extension].__file__).st_mtime
+        except (KeyError, OSError):
+            return None
+
+    async def reload(self, extension):
+        started = time.perf_counter()
+        for cog in list(self.bot.cogs.values()):
+            if type(cog).__module__ == extension and hasattr(cog, 'cog_handoff'):
+                stash(self.bot, cog, await cog.cog_handoff())
+        try:
+            await self.bot.reload_extension(extension)
+        finally:
+            self.mtimes[extension] = self.mtime(extension)
+        return time.perf_counter() - started
+
+    @app_commands.command(name="reload", description="Reload a bot extension in place (bot owner only)")
+    @app_commands.describe(extension="The extension to reload, e.g. chatgpt")
+    async def reload_command(self, interaction: discord.Interaction, extension: str):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("Only the bot owner can reload extensions.", ephemeral=True)
+            return
+
+        if extension not in self.bot.extensions:
+            await interaction.response.send_message(f"`{extension}` is not a loaded extension.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            seconds = await self.reload(extension)
+            await interaction.followup.send(f"Reloaded `{extension}` in {seconds * 1000:.0f} ms.", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"Reloading `{extension}` failed, the previous version is still running: {str(e)}", ephemeral=True)
+            logger.exception("Error reloading %s", extension)
+
+    @reload_command.autocomplete("extension")
+    async def extension_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=extension, value=extension)
+                for extension in self.bot.extensions if current.lower() in extension][:25]
+
+    @tasks.loop(seconds=WATCH_INTERVAL)
+    async def watch(self):
+        for extension in list(self.bot.extensions):
+            # Reloading this extension from here would cancel the loop mid-reload.
+            if extension == __name__:
+                continue
+            mtime = self.mtime(extension)
+            if extension not in self.mtimes:
+                self.mtimes[extension] = mtime
+            elif mtime != self.mtimes[extension]:
+                try:
+                    seconds = await self.reload(extension)
+                    logger.info("Reloaded %s in %.0f ms", extension, seconds * 1000)
+                except Exception:
+                    logger.exception("Error reloading %s", extension)
+
+
+async def setup(bot):
+    await bot.add_cog(HotReload(bot))
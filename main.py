@@ -1,37 +1,186 @@
-    c.execute('''CREATE TABLE IF NOT EXISTS deleted_messages
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  guild_id INTEGER,
-                  channel_id INTEGER,
-                  content TEXT,
-                  deleted_at TIMESTAMP)''')
-    conn.commit()
-    conn.close()
-
-init_db()
-
-@bot.event
-async def on_ready():
-    print(f'{bot.user} has connected to Discord!')
+import discord
+from discord.ext import commands
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+import database
+import message_pipeline
+import monitoring
+import sharding
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger('main')
+DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+# The tree is only synced when its hash differs from the one stored here,
+# next to the databases unless the path is absolute.
+COMMAND_HASH_FILE = os.path.join(database.DATA_DIR, os.getenv('COMMAND_HASH_FILE', '.command_tree_hash'))
+
+# Loaded in this order with bot.load_extension. Cogs keep heavy dependencies
+# (openai, tiktoken, pandas, matplotlib, pyarrow) out of their module imports
+# and load them on the first command that needs them.
+EXTENSIONS = [
+    'story_game',
+    'snipe',
+    'chatgpt',
+    'health_track',
+    'study_help',
+    'hot_reload',
+    'monitoring',
+]
+
+# Only the events some handler uses. Typing, reactions, voice, presence,
+# invite and similar events are never sent to the bot.
+intents = discord.Intents.none()
+intents.guilds = True           # channels and guilds, needed for app commands
+intents.guild_messages = True   # /chat context buffers, snipe
+intents.dm_messages = True      # story game turns
+intents.message_content = True  # all of the above read message text
+intents.members = True          # member names in snipes and story games
+
+# Seconds between starting worker processes, per shard the previous worker
+# identifies, so processes don't race each other for Discord's identify limit.
+IDENTIFY_DELAY = 5
+WORKER_RESTART_DELAY = 10
+
+startup_timings = {}
+started_at = time.perf_counter()
+disconnected_at = None
+ready_once = False
+
+def command_tree_hash(tree):
+    commands_json = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c['type'], c['name']))
+    return hashlib.sha256(json.dumps(commands_json, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands_if_changed(bot):
+    tree_hash = command_tree_hash(bot.tree)
+    try:
+        with open(COMMAND_HASH_FILE) as f:
+            if f.read().strip() == tree_hash:
+                logger.info("Slash commands unchanged, skipping sync")
+                return
+    except FileNotFoundError:
+        pass
+
     await bot.tree.sync()
-    print("Slash commands synced")
+    with open(COMMAND_HASH_FILE, 'w') as f:
+        f.write(tree_hash)
+    logger.info("Slash commands synced")
+
+def create_bot(shard_ids=None, shard_count=None, worker_index=0, worker_count=1):
+    # Nothing reads discord.py's message cache; snipe keeps its own compact
+    # copy of recent messages.
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, shard_ids=shard_ids, shard_count=shard_count,
+                                  max_messages=None, tree_cls=monitoring.MetricsTree)
+    bot.worker_index = worker_index
+    bot.worker_count = worker_count
+
+    @bot.event
+    async def on_ready():
+        global disconnected_at, ready_once
+        logger.info("%s has connected to Discord! (shards %s)", bot.user, bot.shard_ids or "all")
+        if disconnected_at is not None:
+            logger.info("Reconnected in %.2fs", time.perf_counter() - disconnected_at)
+            disconnected_at = None
+        # A shard can disconnect before the first READY, so that alone
+        # doesn't mean the startup work has been done.
+        if ready_once:
+            return
+        ready_once = True
 
-@bot.event
-async def on_message(message):
-    if message.author == bot.user:
-        return
+        logger.info("Ready %.2fs after start", time.perf_counter() - started_at)
+        if sharding.is_primary(bot):
+            sync_started = time.perf_counter()
+            await sync_commands_if_changed(bot)
+            startup_timings['command sync'] = time.perf_counter() - sync_started
+        logger.info("Startup timings: %s", ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in startup_timings.items()),
+                    extra={"startup_ms": {name: round(seconds * 1000, 1) for name, seconds in startup_timings.items()}})
 
-    content = message.content.lower()
+    @bot.event
+    async def on_disconnect():
+        global disconnected_at
+        if disconnected_at is None:
+            disconnected_at = time.perf_counter()
+
+    @bot.event
+    async def on_resumed():
+        global disconnected_at
+        if disconnected_at is not None:
+            logger.info("Resumed session in %.2fs", time.perf_counter() - disconnected_at)
+            disconnected_at = None
+
+    pipeline = message_pipeline.attach(bot)
+
+    @bot.event
+    async def on_message(message):
+        pipeline.dispatch(message)
+
+    return bot
 
 async def setup(bot):
-    await setup_story_game(bot)
-    await setup_snipe_cog(bot)
-    await setup_chatgpt(bot)
-    await setup_health(bot)
+    for extension in EXTENSIONS:
+        extension_started = time.perf_counter()
+        await bot.load_extension(extension)
+        startup_timings[extension] = time.perf_counter() - extension_started
 
-async def main():
+async def main(bot):
     async with bot:
         await setup(bot)
         await bot.start(DISCORD_TOKEN)
 
-asyncio.run(main())
\ No newline at end of file
+def run_worker(shard_ids, shard_count, worker_index, worker_count):
+    monitoring.configure_logging()
+    asyncio.run(main(create_bot(shard_ids, shard_count, worker_index, worker_count)))
+
+def launch_workers(processes, shard_count):
+    """Run the shards as contiguous ranges in ``processes`` worker processes.
+
+    Workers that crash are restarted; Ctrl+C stops them all.
+    """
+    context = multiprocessing.get_context("spawn")
+    ranges = sharding.shard_ranges(shard_count, processes)
+    workers = {}
+
+    def start(index):
+        shard_ids = ranges[index]
+        worker = context.Process(target=run_worker, args=(shard_ids, shard_count, index, processes),
+                                 name=f"shards-{shard_ids[0]}-{shard_ids[-1]}")
+        worker.start()
+        workers[index] = worker
+        logger.info("Started worker %d for shards %d-%d (pid %d)", index, shard_ids[0], shard_ids[-1], worker.pid)
+
+    try:
+        for index in range(processes):
+            if index:
+                time.sleep(IDENTIFY_DELAY * len(ranges[index - 1]))
+            start(index)
+
+        while workers:
+            time.sleep(1)
+            for index, worker in list(workers.items()):
+                if worker.is_alive():
+                    continue
+                if worker.exitcode == 0:
+                    del workers[index]
+                    continue
+                logger.warning("Worker %d exited with code %s, restarting in %ss", index, worker.exitcode, WORKER_RESTART_DELAY)
+                time.sleep(WORKER_RESTART_DELAY)
+                start(index)
+    except KeyboardInterrupt:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.join()
+
+if __name__ == "__main__":
+    # Chart and shard workers are spawned processes that re-import this
+    # module, so the bot must only start when main.py is run directly.
+    monitoring.configure_logging()
+    if sharding.SHARD_PROCESSES > 1:
+        launch_workers(sharding.SHARD_PROCESSES, sharding.SHARD_COUNT or sharding.SHARD_PROCESSES)
+    else:
+        asyncio.run(main(create_bot(shard_count=sharding.SHARD_COUNT)))
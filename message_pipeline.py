@@ -0,0 +1,71 @@
+import asyncio
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    __slots__ = ('handler', 'is_async', 'channels', 'authors', 'ignore_bots')
+
+    def __init__(self, handler, channels, authors, ignore_bots):
+        self.handler = handler
+        self.is_async = inspect.iscoroutinefunction(handler)
+        self.channels = channels
+        self.authors = authors
+        self.ignore_bots = ignore_bots
+
+
+class MessagePipeline:
+    """Routes each incoming message to the handlers whose pre-filters match.
+
+    main.py's on_message is the only message listener, so discord.py creates
+    one task per message instead of one per cog. Handlers subscribe to guild
+    messages or DMs and can narrow that further with containers of channel
+    or author ids, checked with a single ``in`` each. Plain functions run
+    inline; coroutine functions get a task only once their filters pass.
+    """
+
+    def __init__(self):
+        self.guild_subscriptions = []
+        self.dm_subscriptions = []
+        self.dispatched = 0
+
+    def subscribe(self, handler, *, guilds=False, dms=False, channels=None, authors=None, ignore_bots=False):
+        subscription = Subscription(handler, channels, authors, ignore_bots)
+        if guilds:
+            self.guild_subscriptions.append(subscription)
+        if dms:
+            self.dm_subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for subscriptions in (self.guild_subscriptions, self.dm_subscriptions):
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+
+    def dispatch(self, message):
+        self.dispatched += 1
+        subscriptions = self.dm_subscriptions if message.guild is None else self.guild_subscriptions
+        for subscription in subscriptions:
+            if subscription.ignore_bots and message.author.bot:
+                continue
+            if subscription.channels is not None and message.channel.id not in subscription.channels:
+                continue
+            if subscription.authors is not None and message.author.id not in subscription.authors:
+                continue
+            if subscription.is_async:
+                asyncio.create_task(subscription.handler(message))
+                continue
+            try:
+                subscription.handler(message)
+            except Exception:
+                logger.exception("Error in message handler %s", subscription.handler.__qualname__)
+
+
+def attach(bot):
+    """Return the bot's shared pipeline, creating it on first use."""
+    pipeline = getattr(bot, 'message_pipeline', None)
+    if pipeline is None:
+        pipeline = bot.message_pipeline = MessagePipeline()
+    return pipeline
@@ -0,0 +1,186 @@
+import bisect
+import math
+import threading
+import time
+
+# Seconds. Covers everything from a cached SQLite read to a slow completion.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    """A named family of samples, one per combination of label values.
+
+    Values are updated from the event loop and from database threads, so
+    every update takes the metric's lock.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.label_names, key, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        # For totals some other object already keeps, copied in on each scrape.
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts plus the running sum and count.
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, (("le", format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_bucket", key, (("le", "+Inf"),), count))
+            samples.append((f"{self.name}_sum", key, (), total))
+            samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+
+class Timer:
+    """Observes the time spent in a ``with`` block; ``labels`` may be changed inside it."""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """The Prometheus text exposition format, version 0.0.4."""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+# Defined once here rather than in the cogs, so reloading an extension keeps
+# its series instead of registering them a second time.
+REGISTRY = Registry()
+
+COMMAND_DURATION = REGISTRY.register(Histogram(
+    "bot_command_duration_seconds", "Time from receiving a slash command to its handler returning.",
+    ("cog", "command", "status")))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    "bot_sqlite_query_duration_seconds", "Time spent running a database call, on the writer thread or a reader connection.",
+    ("database", "status")))
+DB_QUERY_WAIT = REGISTRY.register(Histogram(
+    "bot_sqlite_queue_wait_seconds", "Time a database call waited for the writer thread.", ("database",)))
+OPENAI_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "bot_openai_request_duration_seconds", "Duration of each OpenAI request attempt, streams until the last delta.",
+    ("kind", "status")))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop woke a sleeping probe task.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "bot_queue_depth", "Items waiting in an in-process queue.", ("queue",)))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "bot_in_flight", "Operations currently being worked on.", ("operation",)))
+MESSAGES_DISPATCHED = REGISTRY.register(Counter(
+    "bot_messages_dispatched_total", "Messages routed through the message pipeline since start."))
+OUTBOUND_MESSAGES = REGISTRY.register(Counter(
+    "bot_outbound_messages_total", "Messages sent and merged by the outbound scheduler since start.", ("result",)))
+RESPONSE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "bot_chat_response_cache_lookups_total", "ChatGPT response cache lookups since start, by hit or miss.", ("result",)))
+CHART_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "bot_chart_cache_lookups_total", "Rendered chart cache lookups since start, by hit or miss.", ("result",)))
+CHART_CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "bot_chart_cache_evictions_total", "Rendered charts evicted from the chart cache since start."))
+ACTIVE_STORY_GAMES = REGISTRY.register(Gauge(
+    "bot_story_games_active", "Story games hosted by this process."))
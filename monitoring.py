@@ -0,0 +1,172 @@
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+from aiohttp import web
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import metrics
+import outbound
+import sharding
+
+logger = logging.getLogger(__name__)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# discord.py logs every gateway event at DEBUG, so it has its own level.
+DISCORD_LOG_LEVEL = os.getenv('DISCORD_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# The /metrics endpoint only listens on localhost unless told otherwise.
+# Shard worker N listens on METRICS_PORT + N; 0 turns the endpoint off.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+LAG_PROBE_INTERVAL = 1.0
+LAG_PROBE_SLEEP = 0.1
+
+# Attributes every LogRecord has; anything else was passed with extra=.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra=`` fields as keys."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-8s %(name)s: %(message)s"))
+    logging.basicConfig(level=LOG_LEVEL, handlers=[handler], force=True)
+    logging.getLogger('discord').setLevel(DISCORD_LOG_LEVEL)
+
+
+class MetricsTree(app_commands.CommandTree):
+    """Command tree that times every slash command, labelled by cog and command."""
+
+    async def _call(self, interaction):
+        if interaction.type is not discord.InteractionType.application_command:
+            return await super()._call(interaction)
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            await super()._call(interaction)
+            status = "failed" if interaction.command_failed else "ok"
+        finally:
+            command = interaction.command
+            binding = getattr(command, 'binding', None)
+            metrics.COMMAND_DURATION.observe(
+                time.perf_counter() - started,
+                cog=type(binding).__name__ if binding is not None else "",
+                command=command.qualified_name if command is not None else "unknown",
+                status=status)
+
+
+class Monitoring(commands.Cog):
+    """Serves the metrics in metrics.REGISTRY over HTTP and probes event loop lag.
+
+    Counters and histograms are updated where the work happens. Queue depths
+    and totals other objects already keep are copied into their gauges when
+    the endpoint is scraped, so the cogs don't need to know about metrics.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.runner = None
+
+    async def cog_load(self):
+        self.probe_lag.start()
+        if METRICS_PORT:
+            worker_index, _ = sharding.worker_slot(self.bot)
+            app = web.Application()
+            app.router.add_get('/metrics', self.serve_metrics)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            try:
+                await web.TCPSite(self.runner, METRICS_HOST, METRICS_PORT + worker_index).start()
+            except OSError:
+                # A port already in use shouldn't stop the cog or the bot.
+                logger.exception("Could not serve metrics on %s:%d", METRICS_HOST, METRICS_PORT + worker_index)
+                await self.runner.cleanup()
+                self.runner = None
+                return
+            logger.info("Serving metrics on http://%s:%d/metrics", METRICS_HOST, METRICS_PORT + worker_index)
+
+    async def cog_unload(self):
+        self.probe_lag.cancel()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def serve_metrics(self, request):
+        self.collect()
+        return web.Response(body=metrics.REGISTRY.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    def collect(self):
+        scheduler = getattr(self.bot, 'outbound', None)
+        if scheduler is not None:
+            # Routes are summed by kind; webhook routes contain tokens.
+            depths = dict.fromkeys(outbound.ROUTE_LIMITS, 0)
+            for route, depth in scheduler.queue_depths().items():
+                kind = route.split(':', 1)[0]
+                depths[kind] = depths.get(kind, 0) + depth
+            for kind, depth in depths.items():
+                metrics.QUEUE_DEPTH.set(depth, queue=f"outbound_{kind}")
+            metrics.OUTBOUND_MESSAGES.set(scheduler.sent, result="sent")
+            metrics.OUTBOUND_MESSAGES.set(scheduler.merged, result="merged")
+
+        pipeline = getattr(self.bot, 'message_pipeline', None)
+        if pipeline is not None:
+            metrics.MESSAGES_DISPATCHED.set(pipeline.dispatched)
+
+        # A cog in the middle of a reload has already handed its store over.
+        chat = self.bot.get_cog('ChatGPTCommands')
+        if chat is not None:
+            metrics.QUEUE_DEPTH.set(chat.queue_depth, queue="openai")
+            metrics.IN_FLIGHT.set(chat.in_flight, operation="openai")
+            if chat.response_cache is not None:
+                metrics.RESPONSE_CACHE_LOOKUPS.set(chat.response_cache.hits, result="hit")
+                metrics.RESPONSE_CACHE_LOOKUPS.set(chat.response_cache.misses, result="miss")
+
+        health = self.bot.get_cog('HealthTrackingCog')
+        if health is not None and health.charts is not None:
+            metrics.IN_FLIGHT.set(health.charts.pending, operation="chart_render")
+            stats = health.chart_cache.stats()
+            metrics.CHART_CACHE_LOOKUPS.set(stats["hits"], result="hit")
+            metrics.CHART_CACHE_LOOKUPS.set(stats["misses"], result="miss")
+            metrics.CHART_CACHE_EVICTIONS.set(stats["evictions"])
+
+        snipe = self.bot.get_cog('SnipeCog')
+        if snipe is not None and snipe.store is not None:
+            metrics.QUEUE_DEPTH.set(len(snipe.store.pending), queue="snipe_writes")
+
+        story = self.bot.get_cog('StoryGame')
+        if story is not None:
+            metrics.ACTIVE_STORY_GAMES.set(len(story.games))
+            metrics.IN_FLIGHT.set(len(story.turns), operation="story_turns")
+
+    @tasks.loop(seconds=LAG_PROBE_INTERVAL)
+    async def probe_lag(self):
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_SLEEP)
+        metrics.EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - LAG_PROBE_SLEEP))
+
+
+async def setup(bot):
+    await bot.add_cog(Monitoring(bot))
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+import discord
+
+# Discord's documented send limits, as (requests, per seconds). Channels and
+# DMs share a per-channel bucket, interaction followups a per-token bucket,
+# and every route counts towards the global limit.
+ROUTE_LIMITS = {
+    "channel": (5, 5.0),
+    "dm": (5, 5.0),
+    "webhook": (5, 2.0),
+}
+GLOBAL_LIMIT = (50, 1.0)
+MESSAGE_LIMIT = 2000
+
+
+class Bucket:
+    """Sliding-window limiter allowing ``rate`` acquisitions per ``per`` seconds."""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self._sent = deque()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0] >= self.per:
+                self._sent.popleft()
+            if len(self._sent) < self.rate:
+                self._sent.append(now)
+                return
+            await asyncio.sleep(self.per - (now - self._sent[0]))
+
+    def idle(self):
+        """Whether the window has emptied, so a fresh bucket would behave the same."""
+        return not self._sent or time.monotonic() - self._sent[-1] >= self.per
+
+
+def route_of(target):
+    if isinstance(target, discord.Webhook):
+        return f"webhook:{target.id}:{target.token}"
+    if isinstance(target, discord.abc.User):
+        return f"dm:{target.id}"
+    return f"channel:{target.id}"
+
+
+class OutboundScheduler:
+    """Queues sends per route and paces them against Discord's bucket limits.
+
+    Each route gets a worker only while it has messages queued. Adjacent
+    plain-text messages sent with ``merge=True`` to the same route are joined
+    into one message when they fit, and all of their callers get that message.
+    """
+
+    def __init__(self, route_limits=ROUTE_LIMITS, global_limit=GLOBAL_LIMIT):
+        self.route_limits = route_limits
+        self.global_bucket = Bucket(*global_limit)
+        self.cogs = set()
+        self._queues = {}
+        self._buckets = {}
+        self._workers = {}
+        self.sent = 0
+        self.merged = 0
+
+    def register(self, cog):
+        self.cogs.add(type(cog).__name__)
+        return self
+
+    def send(self, target, content=None, merge=False, **kwargs):
+        """Queue a send and return a future for the sent message."""
+        route = route_of(target)
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(route, deque()).append((target, content, merge, kwargs, future))
+        if route not in self._workers:
+            self._workers[route] = asyncio.create_task(self._drain(route))
+        return future
+
+    async def _drain(self, route):
+        queue = self._queues[route]
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = Bucket(*self.route_limits[route.split(":", 1)[0]])
+        try:
+            while queue:
+                target, content, merge, kwargs, future = queue.popleft()
+                futures = [future]
+                while merge and queue and self._can_merge(content, kwargs, queue[0]):
+                    _, next_content, _, _, next_future = queue.popleft()
+                    content = f"{content}\n{next_content}"
+                    futures.append(next_future)
+                    self.merged += 1
+
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    message = await target.send(content, **kwargs)
+                except Exception as e:
+                    for f in futures:
+                        if not f.done():
+                            f.set_exception(e)
+                else:
+                    self.sent += 1
+                    for f in futures:
+                        if not f.done():
+                            f.set_result(message)
+        finally:
+            del self._workers[route]
+            if not queue:
+                del self._queues[route]
+            self._drop_idle_buckets()
+
+    def _drop_idle_buckets(self):
+        # Every interaction followup and DM is its own route, and webhook
+        # routes hold interaction tokens, so buckets are only kept while
+        # they still limit anything.
+        for route in [route for route, bucket in self._buckets.items()
+                      if route not in self._workers and bucket.idle()]:
+            del self._buckets[route]
+
+    @staticmethod
+    def _can_merge(content, kwargs, queued):
+        _, next_content, next_merge, next_kwargs, _ = queued
+        return (next_merge and content is not None and next_content is not None
+                and next_kwargs == kwargs and len(content) + len(next_content) + 1 <= MESSAGE_LIMIT)
+
+    def queue_depths(self):
+        return {route: len(queue) for route, queue in self._queues.items()}
+
+    def stats(self):
+        return {"sent": self.sent, "merged": self.merged, "routes": len(self._queues),
+                "cogs": sorted(self.cogs), "queue_depths": self.queue_depths()}
+
+    async def close(self):
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+
+def attach(bot, cog):
+    """Register ``cog`` with the bot's shared scheduler, creating it on first use."""
+    scheduler = getattr(bot, "outbound", None)
+    if scheduler is None:
+        scheduler = bot.outbound = OutboundScheduler()
+    return scheduler.register(cog)
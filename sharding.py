@@ -0,0 +1,48 @@
+import os
+
+# SHARD_PROCESSES > 1 makes main.py a launcher that runs the SHARD_COUNT
+# shards as contiguous ranges across that many worker processes. Every
+# process shares the databases in DATA_DIR; in-memory state stays with the
+# process that owns the guild, since Discord only sends a guild's events to
+# its shard. DMs always arrive on shard 0.
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', 1))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+
+
+def shard_ranges(shard_count, processes):
+    if not 0 < processes <= shard_count:
+        raise ValueError(f"SHARD_PROCESSES ({processes}) must be between 1 and SHARD_COUNT ({shard_count}); "
+                         "every worker process needs at least one shard")
+    return [list(range(i * shard_count // processes, (i + 1) * shard_count // processes))
+            for i in range(processes)]
+
+
+def shard_of(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+def is_partitioned(bot):
+    shard_ids = getattr(bot, 'shard_ids', None)
+    return shard_ids is not None and bot.shard_count is not None and len(shard_ids) < bot.shard_count
+
+
+def owns_guild(bot, guild_id):
+    """Whether this process handles ``guild_id``; None stands for DMs."""
+    if not is_partitioned(bot):
+        return True
+    shard = 0 if guild_id is None else shard_of(guild_id, bot.shard_count)
+    return shard in bot.shard_ids
+
+
+def owns_dms(bot):
+    return owns_guild(bot, None)
+
+
+def is_primary(bot):
+    # The process holding shard 0 also runs the once-per-deployment work:
+    # command sync and database maintenance.
+    return owns_dms(bot)
+
+
+def worker_slot(bot):
+    return getattr(bot, 'worker_index', 0), getattr(bot, 'worker_count', 1)
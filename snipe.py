@@ -1,24 +1,279 @@
-                  (message.author.id, message.guild.id, message.channel.id, message.content, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+from collections import OrderedDict, deque
+from datetime import datetime
+import logging
+import os
+import weakref
+import hot_reload
+import message_pipeline
+import sharding
+from snipe_storage import SnipeStore
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv('SNIPE_RETENTION_DAYS', 30))
+MAX_PER_CHANNEL = int(os.getenv('SNIPE_MAX_PER_CHANNEL', 500))
+HOT_PER_CHANNEL = int(os.getenv('SNIPE_HOT_PER_CHANNEL', 10))
+HOT_MAX_ENTRIES = int(os.getenv('SNIPE_HOT_MAX_ENTRIES', 50000))
+# How many recent guild messages are remembered so their content is known
+# when they are deleted. The bot runs without discord.py's message cache.
+SENT_MAX_ENTRIES = int(os.getenv('SNIPE_SENT_MAX_ENTRIES', 5000))
+
+def deleted_row(message_id, sent):
+    # The message id doubles as the row id, so rows still in the write-behind
+    # queue already have the id they will be stored under. Deletions from one
+    # purge share a timestamp and are told apart by it when paging.
+    user_id, guild_id, channel_id, content = sent
+    return (message_id, user_id, guild_id, channel_id, content, datetime.now().isoformat())
+
+def hot_row(row):
+    # Same shape as rows read back from deleted_messages.
+    message_id, user_id, _, _, content, deleted_at = row
+    return (message_id, user_id, content, deleted_at)
+
+class RecentDeletions:
+    """The newest deleted messages of recently active channels, in memory.
+
+    Every deletion is added here as well as queued for the database, so a
+    channel's deque always holds its newest deletions, newest first. Channels
+    are evicted least recently used first once ``max_entries`` is exceeded.
+    """
+
+    def __init__(self, per_channel=HOT_PER_CHANNEL, max_entries=HOT_MAX_ENTRIES):
+        self.per_channel = per_channel
+        self.max_entries = max_entries
+        self.entries = 0
+        self._channels = OrderedDict()
+
+    def add(self, channel_id, row):
+        rows = self._channels.get(channel_id)
+        if rows is None:
+            rows = self._channels[channel_id] = deque(maxlen=self.per_channel)
+        else:
+            self._channels.move_to_end(channel_id)
+        if len(rows) < self.per_channel:
+            self.entries += 1
+        rows.appendleft(row)
+        self._evict()
+
+    def seed(self, channel_id, rows):
+        self.drop(channel_id)
+        # Empty channels take no entries, so they would never be evicted.
+        if not rows:
+            return
+        self._channels[channel_id] = deque(rows[:self.per_channel], maxlen=self.per_channel)
+        self.entries += len(self._channels[channel_id])
+        self._evict()
+
+    def latest(self, channel_id):
+        rows = self._channels.get(channel_id)
+        if rows is None:
+            return None
+        self._channels.move_to_end(channel_id)
+        return list(rows)
+
+    def drop(self, channel_id):
+        rows = self._channels.pop(channel_id, None)
+        if rows is not None:
+            self.entries -= len(rows)
+
+    def _evict(self):
+        while self.entries > self.max_entries and self._channels:
+            self.drop(next(iter(self._channels)))
+
+class SentMessages:
+    """Author, location and content of the newest guild messages, by id.
+
+    A compact stand-in for discord.py's message cache, holding only what a
+    deleted_messages row needs. The oldest messages are forgotten first.
+    """
+
+    def __init__(self, max_entries=SENT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._messages = OrderedDict()
+
+    def add(self, message):
+        self._messages[message.id] = (message.author.id, message.guild.id, message.channel.id, message.content)
+        if len(self._messages) > self.max_entries:
+            self._messages.popitem(last=False)
+
+    def edit(self, message_id, content):
+        sent = self._messages.get(message_id)
+        if sent is not None:
+            self._messages[message_id] = sent[:3] + (content,)
+
+    def pop(self, message_id):
+        return self._messages.pop(message_id, None)
+
+class SnipeCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.store = SnipeStore(
+            flush_size=int(os.getenv('SNIPE_FLUSH_SIZE', 100)),
+            flush_interval=float(os.getenv('SNIPE_FLUSH_INTERVAL', 2.0))
+        )
+        self.recent = RecentDeletions()
+        self.sent = SentMessages()
+        self.views = weakref.WeakSet()
+        self.subscription = None
+
+    async def cog_load(self):
+        state = hot_reload.claim(self.bot, self)
+        if state:
+            await self.store.close()
+            self.store = state["store"]
+            self.recent = hot_reload.rebuild(RecentDeletions, state["recent"])
+            self.sent = hot_reload.rebuild(SentMessages, state["sent"])
+            # Open /snipe views keep their old class until they time out a
+            # minute later; they only page through rows via the new cog.
+            for view in state["views"]:
+                view.cog = self
+                self.views.add(view)
+        else:
+            await self.store.load(convert=sharding.is_primary(self.bot))
+        self.subscription = message_pipeline.attach(self.bot).subscribe(
+            self.sent.add, guilds=True, ignore_bots=True)
+        # Every shard process shares snipe_data.db, so only one maintains it.
+        if sharding.is_primary(self.bot):
+            self.maintenance.start()
+
+    async def cog_unload(self):
+        message_pipeline.attach(self.bot).unsubscribe(self.subscription)
+        self.maintenance.cancel()
+        if self.store is not None:
+            await self.store.close()
+
+    async def cog_handoff(self):
+        state = {"store": self.store, "recent": hot_reload.export(self.recent),
+                 "sent": hot_reload.export(self.sent), "views": list(self.views)}
+        self.store = None
+        return state
+
+    @tasks.loop(hours=1)
+    async def maintenance(self):
+        try:
+            stats = await self.store.run_maintenance(RETENTION_DAYS, MAX_PER_CHANNEL)
+            logger.info("Snipe maintenance: pruned %d, capped %d, reclaimed %d bytes%s",
+                        stats['pruned'], stats['capped'], stats['reclaimed_bytes'],
+                        '' if stats['complete'] else ' (partial)', extra=stats)
+        except Exception:
+            logger.exception("Error in snipe maintenance")
+
+    @app_commands.command(name="snipe_retention", description="Set how many days deleted messages are kept in this server")
+    @app_commands.describe(days=f"Days to keep deleted messages (default {RETENTION_DAYS})")
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.guild_only()
+    async def snipe_retention(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 365]):
+        await self.store.set_retention(interaction.guild.id, days)
+        await interaction.response.send_message(f"Deleted messages will now be kept for {days} days.", ephemeral=True)
+
+    @app_commands.command(name="snipe", description="Show recently deleted messages in this channel")
+    @app_commands.guild_only()
+    async def snipe(self, interaction: discord.Interaction):
+        view = SnipeView(self, interaction.guild.id, interaction.channel.id)
+        self.views.add(view)
+        await view.load_first()
+        if not view.rows:
+            await interaction.response.send_message("There's nothing to snipe in this channel.", ephemeral=True)
+            return
+
+        await interaction.response.send_message(embed=view.current_embed(), view=view)
+
+    def build_embed(self, row, position):
+        _, user_id, content, deleted_at = row
+        user = self.bot.get_user(user_id)
+        embed = discord.Embed(description=content, color=discord.Color.red(), timestamp=datetime.fromisoformat(deleted_at))
+        embed.set_author(name=user.display_name if user else str(user_id),
+                         icon_url=user.display_avatar.url if user else None)
+        embed.set_footer(text=f"Deleted message {position}")
+        return embed
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        if 'content' in payload.data:
+            self.sent.edit(payload.message_id, payload.data['content'])
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        sent = self.sent.pop(payload.message_id)
+        if sent is None:
+            return
+        row = deleted_row(payload.message_id, sent)
+        self.store.queue([row])
+        self.recent.add(payload.channel_id, hot_row(row))
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        # Purges arrive as one event; only messages still remembered carry
+        # their content. They are written as a single transaction.
+        sent = [(message_id, self.sent.pop(message_id)) for message_id in sorted(payload.message_ids)]
+        rows = [deleted_row(message_id, entry) for message_id, entry in sent if entry is not None]
+        if rows:
+            self.store.queue(rows)
+            for row in rows:
+                self.recent.add(payload.channel_id, hot_row(row))
+            await self.store.flush()
+
+def row_key(row):
+    return (row[3], row[0])
 
 class SnipeView(discord.ui.View):
-    def __init__(self, pages):
+    """Pages through a channel's deleted messages without loading them all.
+
+    Only a window of up to ``PREFETCH`` rows is held at a time. The first
+    window comes from the cog's in-memory recent deletions when the channel
+    is there. Moving past either end of the window fetches the neighbouring
+    rows with a keyset query, and embeds are built only for the page being
+    shown.
+    """
+
+    PREFETCH = 5
+
+    def __init__(self, cog, guild_id, channel_id):
         super().__init__(timeout=60)
-        self.pages = pages
+        self.cog = cog
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.rows = []
+        self.offset = 0
+        self.index = 0
+
+    async def load_first(self):
+        self.rows = self.cog.recent.latest(self.channel_id)
+        if self.rows is None:
+            self.rows = await self.cog.store.older_deleted(self.guild_id, self.channel_id, self.PREFETCH)
+            self.cog.recent.seed(self.channel_id, self.rows)
+        self.offset = 0
         self.index = 0
 
+    def current_embed(self):
+        return self.cog.build_embed(self.rows[self.index - self.offset], self.index + 1)
+
     @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, emoji="⬅️")
     async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.index > 0:
+            if self.index == self.offset:
+                rows = await self.cog.store.newer_deleted(self.guild_id, self.channel_id, self.PREFETCH, row_key(self.rows[0]))
+                if not rows:
+                    return
+                self.rows = rows
+                self.offset -= len(rows)
             self.index -= 1
-            await interaction.response.edit_message(embed=self.pages[self.index], view=self)
+            await interaction.response.edit_message(embed=self.current_embed(), view=self)
 
     @discord.ui.button(label="Next", style=discord.ButtonStyle.grey, emoji="➡️")
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.index < len(self.pages) - 1:
+        if self.rows:
+            if self.index == self.offset + len(self.rows) - 1:
+                rows = await self.cog.store.older_deleted(self.guild_id, self.channel_id, self.PREFETCH, before=row_key(self.rows[-1]))
+                if not rows:
+                    return
+                self.offset += len(self.rows)
+                self.rows = rows
             self.index += 1
-            await interaction.response.edit_message(embed=self.pages[self.index], view=self)
+            await interaction.response.edit_message(embed=self.current_embed(), view=self)
 
 async def setup(bot):
-    await bot.add_cog(SnipeCog(bot))
\ No newline at end of file
+    await bot.add_cog(SnipeCog(bot))
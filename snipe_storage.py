@@ -0,0 +1,221 @@
+import asyncio
+import contextlib
+import logging
+import time
+from datetime import datetime, timedelta
+from database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    # 1: original schema, previously created by init_db in main.py
+    '''
+    CREATE TABLE IF NOT EXISTS deleted_messages
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+         user_id INTEGER,
+         guild_id INTEGER,
+         channel_id INTEGER,
+         content TEXT,
+         deleted_at TIMESTAMP);
+    ''',
+    # 2: channel lookups newest first; the rowid tiebreak comes with the index
+    '''
+    CREATE INDEX IF NOT EXISTS idx_deleted_channel ON deleted_messages (guild_id, channel_id, deleted_at);
+    ''',
+    # 3: per-guild retention and an index for pruning by age
+    '''
+    CREATE TABLE IF NOT EXISTS guild_settings
+        (guild_id INTEGER PRIMARY KEY, retention_days INTEGER);
+    CREATE INDEX IF NOT EXISTS idx_deleted_at ON deleted_messages (deleted_at);
+    ''',
+]
+
+# Maintenance deletes and vacuums in chunks of this many rows or pages, each
+# in its own short transaction, so regular writes can interleave.
+MAINTENANCE_CHUNK = 500
+
+
+class SnipeStore(AsyncDatabase):
+    """Write-behind store for deleted messages.
+
+    Deletions are queued in memory and written in a single transaction once
+    ``flush_size`` rows are waiting or ``flush_interval`` seconds have passed,
+    whichever comes first.
+    """
+
+    def __init__(self, path='snipe_data.db', flush_size=100, flush_interval=2.0):
+        super().__init__(path)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self._flush_needed = asyncio.Event()
+        self._flusher = None
+        # The last (guild_id, channel_id) checked against the per-channel cap,
+        # so a run cut short by its time budget resumes where it stopped.
+        self._cap_cursor = (-1, -1)
+
+    async def load(self, convert=True):
+        await self.migrate(MIGRATIONS)
+        # The conversion holds the write lock for a whole VACUUM, so only the
+        # process that maintains the file runs it; the others skip it.
+        if convert:
+            await self.run(self._enable_incremental_vacuum)
+        self.start()
+
+    @staticmethod
+    def _enable_incremental_vacuum(conn):
+        # Switching an existing file to incremental auto-vacuum needs one full
+        # VACUUM; after that free pages can be released a chunk at a time.
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+
+    def start(self):
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def queue(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= self.flush_size:
+            self._flush_needed.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error saving deleted messages")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        try:
+            # Rows carry their message id; a message deleted twice is kept once.
+            await self.executemany('''INSERT OR IGNORE INTO deleted_messages
+                                      (id, user_id, guild_id, channel_id, content, deleted_at)
+                                      VALUES (?, ?, ?, ?, ?, ?)''', rows)
+        except BaseException:
+            # Keep the batch, ahead of anything queued meanwhile, for the next flush.
+            self.pending[:0] = rows
+            raise
+
+    async def older_deleted(self, guild_id, channel_id, limit, before=None):
+        """Return up to ``limit`` rows, newest first, older than the ``before`` key.
+
+        Keys are ``(deleted_at, id)`` pairs, so paging never uses OFFSET and
+        each page is a bounded index range scan.
+        """
+        await self.flush()
+        if before is None:
+            return await self.fetchall('''SELECT id, user_id, content, deleted_at FROM deleted_messages
+                                          WHERE guild_id = ? AND channel_id = ?
+                                          ORDER BY deleted_at DESC, id DESC LIMIT ?''',
+                                       (guild_id, channel_id, limit))
+        return await self.fetchall('''SELECT id, user_id, content, deleted_at FROM deleted_messages
+                                      WHERE guild_id = ? AND channel_id = ? AND (deleted_at, id) < (?, ?)
+                                      ORDER BY deleted_at DESC, id DESC LIMIT ?''',
+                                   (guild_id, channel_id, *before, limit))
+
+    async def newer_deleted(self, guild_id, channel_id, limit, after):
+        """Return up to ``limit`` rows newer than the ``after`` key, newest first."""
+        await self.flush()
+        rows = await self.fetchall('''SELECT id, user_id, content, deleted_at FROM deleted_messages
+                                      WHERE guild_id = ? AND channel_id = ? AND (deleted_at, id) > (?, ?)
+                                      ORDER BY deleted_at ASC, id ASC LIMIT ?''',
+                                   (guild_id, channel_id, *after, limit))
+        return rows[::-1]
+
+    async def set_retention(self, guild_id, days):
+        await self.execute("INSERT OR REPLACE INTO guild_settings (guild_id, retention_days) VALUES (?, ?)", (guild_id, days))
+
+    async def run_maintenance(self, retention_days, max_per_channel, time_budget=2.0):
+        """Prune old and excess rows, vacuum freed pages and refresh statistics.
+
+        Work stops once ``time_budget`` seconds have been spent; whatever is
+        left is picked up by the next run. Returns a summary of the work done.
+        """
+        await self.flush()
+        deadline = time.monotonic() + time_budget
+        stats = {"pruned": 0, "capped": 0, "reclaimed_bytes": 0, "complete": False}
+
+        default_cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        guild_cutoffs = [(guild_id, (datetime.now() - timedelta(days=days)).isoformat())
+                         for guild_id, days in await self.fetchall("SELECT guild_id, retention_days FROM guild_settings")]
+
+        jobs = [('''SELECT id FROM deleted_messages WHERE deleted_at < ?
+                    AND guild_id NOT IN (SELECT guild_id FROM guild_settings) LIMIT ?''', (default_cutoff, MAINTENANCE_CHUNK), "pruned")]
+        jobs += [("SELECT id FROM deleted_messages WHERE guild_id = ? AND deleted_at < ? LIMIT ?",
+                  (guild_id, cutoff, MAINTENANCE_CHUNK), "pruned")
+                 for guild_id, cutoff in guild_cutoffs]
+
+        def _delete_chunk(conn, select, params):
+            with conn:
+                return conn.execute(f"DELETE FROM deleted_messages WHERE id IN ({select})", params).rowcount
+
+        async def _delete_all(select, params, counter):
+            while time.monotonic() < deadline:
+                deleted = await self.run(_delete_chunk, select, params)
+                stats[counter] += deleted
+                if deleted < MAINTENANCE_CHUNK:
+                    return True
+            return False
+
+        for select, params, counter in jobs:
+            if not await _delete_all(select, params, counter):
+                return stats
+
+        # Channels are visited one at a time along idx_deleted_channel instead
+        # of counting the whole table in one GROUP BY, so each step is a short
+        # index lookup and the walk can stop at the deadline.
+        def _next_channel(conn, after):
+            return conn.execute('''SELECT guild_id, channel_id FROM deleted_messages
+                                   WHERE (guild_id, channel_id) > (?, ?)
+                                   ORDER BY guild_id, channel_id LIMIT 1''', after).fetchone()
+
+        while time.monotonic() < deadline:
+            channel = await self.run(_next_channel, self._cap_cursor)
+            if channel is None:
+                self._cap_cursor = (-1, -1)
+                break
+            if not await _delete_all('''SELECT id FROM deleted_messages WHERE guild_id = ? AND channel_id = ?
+                                        ORDER BY deleted_at DESC, id DESC LIMIT ? OFFSET ?''',
+                                     (*channel, MAINTENANCE_CHUNK, max_per_channel), "capped"):
+                return stats
+            self._cap_cursor = tuple(channel)
+        else:
+            return stats
+
+        def _vacuum_chunk(conn):
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({MAINTENANCE_CHUNK})").fetchall()
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return (before - after) * page_size, after
+
+        while time.monotonic() < deadline:
+            reclaimed, remaining = await self.run(_vacuum_chunk)
+            stats["reclaimed_bytes"] += reclaimed
+            if not remaining:
+                break
+        else:
+            return stats
+
+        def _analyze(conn):
+            conn.execute("PRAGMA analysis_limit = 400")
+            conn.execute("ANALYZE")
+        await self.run(_analyze)
+        stats["complete"] = True
+        return stats
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
+        await self.flush()
+        await super().close()
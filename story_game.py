@@ -1,54 +1,358 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio
+import logging
 import random
+import time
+import hot_reload
+import message_pipeline
+import outbound
+import sharding
+from story_storage import StoryStore
+
+logger = logging.getLogger(__name__)
+
+# How many "are your DMs open" checks run at once when a game starts.
+DM_PREFLIGHT_CONCURRENCY = 5
+MAX_GAMES_PER_CHANNEL = 3
+# How often a shard process without DMs collects replies relayed from shard 0.
+DM_RELAY_INTERVAL = 1.0
+
+class StoryGameState:
+    __slots__ = ('game_id', 'host', 'players', 'wait_time', 'num_rounds', 'max_players',
+                 'started', 'story', 'original_channel', 'message_id', 'turn_order', 'turn',
+                 'turn_deadline', 'lanes', 'done_lanes')
+
+    def __init__(self, game_id, host, wait_time, num_rounds, max_players, original_channel, lanes=1):
+        self.game_id = game_id
+        self.host = host
+        self.players = {host}
+        self.wait_time = wait_time
+        self.num_rounds = num_rounds
+        self.max_players = max_players
+        self.started = False
+        # one list of sentences per lane; classic games have a single lane
+        self.lanes = lanes
+        self.story = [[] for _ in range(lanes)]
+        self.original_channel = original_channel
+        self.message_id = None
+        self.turn_order = []
+        # index of the current step, where each step is one turn in every
+        # lane, the wall-clock time the step times out (None between steps)
+        # and the lanes already written to in this step
+        self.turn = 0
+        self.turn_deadline = None
+        self.done_lanes = set()
+
+class GameRegistry:
+    """All running story games, indexed by id, host, player and channel.
+
+    Ids are never reused. Each shard process hands out ids from its own
+    residue class (first_id, first_id + id_step, ...), so they stay unique in
+    the shared store. A user can be in at most one game at a time, so every
+    lookup by user is a single dict access.
+    """
+
+    def __init__(self, max_per_channel=MAX_GAMES_PER_CHANNEL, first_id=1, id_step=1):
+        self.max_per_channel = max_per_channel
+        self._games = {}
+        self._by_host = {}
+        self._by_player = {}
+        self._by_channel = {}
+        self._next_id = first_id
+        self._id_step = id_step
+
+    def __len__(self):
+        return len(self._games)
+
+    def __contains__(self, game_id):
+        return game_id in self._games
+
+    def __getitem__(self, game_id):
+        return self._games[game_id]
+
+    def get(self, game_id):
+        return self._games.get(game_id)
+
+    def values(self):
+        return self._games.values()
+
+    def hosted_by(self, user):
+        return self._games.get(self._by_host.get(user.id))
+
+    def game_of(self, user):
+        return self._games.get(self._by_player.get(user.id))
+
+    def channel_full(self, channel):
+        return len(self._by_channel.get(channel.id, ())) >= self.max_per_channel
+
+    def create(self, host, channel, wait_time, num_rounds, max_players, lanes=1):
+        game = StoryGameState(self._next_id, host, wait_time, num_rounds, max_players, channel, lanes)
+        self.restore(game)
+        return game
+
+    def skip_past(self, game_id):
+        if game_id >= self._next_id:
+            self._next_id += ((game_id - self._next_id) // self._id_step + 1) * self._id_step
+
+    def restore(self, game):
+        self._games[game.game_id] = game
+        self.skip_past(game.game_id)
+        self._by_host[game.host.id] = game.game_id
+        for player in game.players:
+            self._by_player[player.id] = game.game_id
+        self._by_channel.setdefault(game.original_channel.id, set()).add(game.game_id)
+
+    def add_player(self, game, user):
+        game.players.add(user)
+        self._by_player[user.id] = game.game_id
+
+    def remove_player(self, game, user):
+        game.players.discard(user)
+        self._by_player.pop(user.id, None)
+
+    def remove(self, game_id):
+        game = self._games.pop(game_id, None)
+        if game is None:
+            return
+        self._by_host.pop(game.host.id, None)
+        for player in game.players:
+            if self._by_player.get(player.id) == game_id:
+                del self._by_player[player.id]
+        channel_games = self._by_channel.get(game.original_channel.id)
+        if channel_games is not None:
+            channel_games.discard(game_id)
+            if not channel_games:
+                del self._by_channel[game.original_channel.id]
 
 class StoryGame(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.games = {}
+        worker_index, worker_count = sharding.worker_slot(bot)
+        self.games = GameRegistry(first_id=worker_index + 1, id_step=worker_count)
+        self.store = StoryStore()
+        # user id -> future resolved with that user's next DM, for players
+        # whose turn it currently is
+        self.turns = {}
+        # Players whose turn is open in another shard process, refreshed from
+        # the store by the process that receives DMs.
+        self.remote_turns = set()
+        self.outbound = outbound.attach(bot, self)
+        # game id -> task running that game's turns
+        self.runners = {}
+        self._resume_task = None
+        # Saved games resume_games has not restored yet.
+        self.unresumed = []
+        self.subscription = None
+
+    async def cog_load(self):
+        state = hot_reload.claim(self.bot, self)
+        if state:
+            await self.store.close()
+            self.store = state["store"]
+            games = state["games"]
+            games["_games"] = {game_id: hot_reload.rebuild(StoryGameState, game)
+                               for game_id, game in games["_games"].items()}
+            self.games = hot_reload.rebuild(GameRegistry, games)
+            self.turns = state["turns"]
+            for game in self.games.values():
+                if game.started:
+                    self.launch(game)
+                elif game.message_id:
+                    self.bot.add_view(StoryGameView(self, game.game_id), message_id=game.message_id)
+            # Saved games the old cog had not resumed yet.
+            if state["saved"]:
+                self.unresumed = state["saved"]
+                self.add_lobby_views(self.unresumed)
+                self._resume_task = asyncio.create_task(self.resume_games())
+            self.start_dm_routing()
+            return
+
+        await self.store.load()
+        saved = await self.store.saved_games()
+        for data in saved:
+            self.games.skip_past(data["game_id"])
+        saved = [data for data in saved if sharding.owns_guild(self.bot, data["guild_id"])]
+        # Lobby buttons must work as soon as the bot connects, so their views
+        # are registered now; players and channels are resolved once ready.
+        self.unresumed = saved
+        self.add_lobby_views(saved)
+        self._resume_task = asyncio.create_task(self.resume_games())
+        self.start_dm_routing()
+
+    def add_lobby_views(self, saved):
+        for data in saved:
+            if not data["started"] and data["message_id"]:
+                self.bot.add_view(StoryGameView(self, data["game_id"]), message_id=data["message_id"])
+
+    def start_dm_routing(self):
+        # Only DMs from players whose turn it is reach route_dm, unless other
+        # shard processes may be waiting on DMs that arrive here.
+        partitioned = sharding.is_partitioned(self.bot)
+        self.subscription = message_pipeline.attach(self.bot).subscribe(
+            self.route_dm, dms=True, authors=None if partitioned else self.turns, ignore_bots=True)
+        if partitioned and not sharding.owns_dms(self.bot):
+            self.relay_replies.start()
+        elif partitioned:
+            self.refresh_remote_turns.start()
+
+    async def cog_unload(self):
+        # Running games are only stopped, not deleted; they carry on from
+        # their last checkpoint the next time the cog loads.
+        await self.stop_games()
+        if self.store is not None:
+            await self.store.close()
+
+    async def cog_handoff(self):
+        # Games are stopped between awaits and relaunched by the reloaded cog
+        # from their in-memory state, exactly as after a restart.
+        await self.stop_games()
+        games = hot_reload.export(self.games)
+        games["_games"] = {game_id: hot_reload.export(game) for game_id, game in games["_games"].items()}
+        state = {"store": self.store, "games": games, "turns": self.turns, "saved": self.unresumed}
+        self.store = None
+        return state
+
+    async def stop_games(self):
+        message_pipeline.attach(self.bot).unsubscribe(self.subscription)
+        self.relay_replies.cancel()
+        self.refresh_remote_turns.cancel()
+        if self._resume_task:
+            self._resume_task.cancel()
+        runners = list(self.runners.values())
+        for task in runners:
+            task.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+
+    async def resume_games(self):
+        # Each game leaves unresumed as it is restored, so a reload that
+        # cancels this task hands the rest to the next cog.
+        saved = self.unresumed
+        await self.bot.wait_until_ready()
+        while saved:
+            data = saved[0]
+            try:
+                game = await self.rehydrate(data)
+            except discord.HTTPException as e:
+                logger.warning("Dropping story game %s: %s", data['game_id'], e, extra={"game_id": data['game_id']})
+                saved.pop(0)
+                await self.store.delete(data["game_id"])
+                continue
+            saved.pop(0)
+            self.games.restore(game)
+            if game.started:
+                await self.outbound.send(game.original_channel, "The bot restarted, picking the story back up where it left off!", merge=True)
+                self.launch(game)
+
+    async def rehydrate(self, data):
+        channel = self.bot.get_channel(data["channel_id"]) or await self.bot.fetch_channel(data["channel_id"])
+
+        async def resolve(user_id):
+            guild = getattr(channel, "guild", None)
+            user = (guild.get_member(user_id) if guild else None) or self.bot.get_user(user_id)
+            return user or await self.bot.fetch_user(user_id)
+
+        host = await resolve(data["host_id"])
+        game = StoryGameState(data["game_id"], host, data["wait_time"], data["num_rounds"], data["max_players"],
+                              channel, data["lanes"])
+        players = [await resolve(user_id) for user_id in data["player_ids"]]
+        game.players = set(players) | {host}
+        game.started = data["started"]
+        game.story = data["story"]
+        game.message_id = data["message_id"]
+        game.turn_order = players if game.started else []
+        game.turn = data["turn"]
+        game.turn_deadline = data["turn_deadline"]
+        game.done_lanes = set(data["done_lanes"])
+        return game
+
+    def route_dm(self, message):
+        turn = self.turns.get(message.author.id)
+        if turn is not None:
+            if not turn.done():
+                turn.set_result(message.content)
+        elif message.author.id in self.remote_turns:
+            # The turn is waiting in another shard process.
+            asyncio.create_task(self.store.post_remote_reply(message.author.id, message.content))
+
+    async def wait_for_turn(self, player, timeout):
+        turn = asyncio.get_running_loop().create_future()
+        self.turns[player.id] = turn
+        remote = sharding.is_partitioned(self.bot) and not sharding.owns_dms(self.bot)
+        try:
+            if remote:
+                await self.store.open_remote_turn(player.id)
+            return await asyncio.wait_for(turn, timeout=timeout)
+        finally:
+            if self.turns.get(player.id) is turn:
+                del self.turns[player.id]
+            if remote:
+                await self.store.close_remote_turn(player.id)
+
+    @tasks.loop(seconds=DM_RELAY_INTERVAL)
+    async def relay_replies(self):
+        if not self.turns:
+            return
+        try:
+            for user_id, content in await self.store.take_remote_replies(list(self.turns)):
+                turn = self.turns.get(user_id)
+                if turn is not None and not turn.done():
+                    turn.set_result(content)
+        except Exception:
+            logger.exception("Error relaying story game replies")
+
+    @tasks.loop(seconds=DM_RELAY_INTERVAL)
+    async def refresh_remote_turns(self):
+        try:
+            self.remote_turns = await self.store.remote_turn_users()
+        except Exception:
+            logger.exception("Error loading remote story game turns")
 
     @app_commands.command(name="host_story", description="Host a story writing game")
     @app_commands.describe(
         wait_time="Time in seconds to wait for each player's response",
         num_rounds="Number of rounds for the game",
-        max_players="Maximum number of players allowed (including host)"
+        max_players="Maximum number of players allowed (including host)",
+        lanes="Number of stories written at the same time, passed between players (1 for the classic game)"
     )
-    async def host_story(self, interaction: discord.Interaction, wait_time: int=120, num_rounds: int=1, max_players: int=5):
+    async def host_story(self, interaction: discord.Interaction, wait_time: int=120, num_rounds: int=1, max_players: int=5, lanes: int=1):
         try:
             await interaction.response.defer(thinking=True)
-            await self.create_game(interaction, wait_time, num_rounds, max_players)
+            await self.create_game(interaction, wait_time, num_rounds, max_players, lanes)
         except Exception as e:
             await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
-            print(f"Error in host_story command: {str(e)}")
+            logger.exception("Error in host_story command")
 
     @app_commands.command(name="cancel_story", description="Cancel the story game you're hosting")
     async def cancel_story(self, interaction: discord.Interaction):
         await self.force_cancel_game(interaction)
 
-    async def create_game(self, interaction: discord.Interaction, wait_time: int, num_rounds: int, max_players: int):
-        if any(game['host'] == interaction.user for game in self.games.values()):
+    async def create_game(self, interaction: discord.Interaction, wait_time: int, num_rounds: int, max_players: int, lanes: int=1):
+        if not 1 <= lanes <= max_players:
+            await interaction.followup.send("The number of stories must be between 1 and the maximum number of players.", ephemeral=True)
+            return
+
+        if self.games.hosted_by(interaction.user):
             await interaction.followup.send("You are already hosting a game.", ephemeral=True)
             return
 
-        game_id = len(self.games) + 1
+        if self.games.game_of(interaction.user):
+            await interaction.followup.send("You are already playing in another game.", ephemeral=True)
+            return
+
+        if self.games.channel_full(interaction.channel):
+            await interaction.followup.send("There are already too many games running in this channel.", ephemeral=True)
+            return
 
-        self.games[game_id] = {
-            'host': interaction.user,
-            'players': set([interaction.user]),
-            'wait_time': wait_time,
-            'num_rounds': num_rounds,
-            'max_players': max_players,
-            'started': False,
-            'story': [],
-            'original_channel': interaction.channel
-        }
+        game = self.games.create(interaction.user, interaction.channel, wait_time, num_rounds, max_players, lanes)
 
         embed = discord.Embed(title=f"{interaction.user.name} is hosting a game of story writers!")
         embed.add_field(name="Max Players", value=str(max_players))
         embed.add_field(name="Rounds", value=str(num_rounds))
         embed.add_field(name="Wait Time", value=f"{wait_time} seconds")
+        if lanes > 1:
+            embed.add_field(name="Stories", value=f"{lanes}, passed around at the same time")
         embed.add_field(
             name="How to Play",
             value=(
@@ -60,21 +364,30 @@ class StoryGame(commands.Cog):
             ),
             inline=False
         )
-        view = StoryGameView(self, interaction, game_id)
-        await interaction.followup.send(embed=embed, view=view)
+        view = StoryGameView(self, game.game_id)
+        message = await interaction.followup.send(embed=embed, view=view)
+        game.message_id = message.id
+        await self.store.save(game)
 
     async def start_game(self, interaction: discord.Interaction, game_id: int):
-        game = self.games[game_id]
-        if game['started']:
+        game = self.games.get(game_id)
+        if game is None or game.started:
             return
 
         # Check if we can DM all players
-        closed_dm_users = []
-        for player in game['players']:
-            try:
-                await player.send("Checking if DMs are open.")
-            except discord.Forbidden:
-                closed_dm_users.append(player)
+        semaphore = asyncio.Semaphore(DM_PREFLIGHT_CONCURRENCY)
+
+        async def dms_open(player):
+            async with semaphore:
+                try:
+                    await self.outbound.send(player, "Checking if DMs are open.")
+                    return True
+                except discord.Forbidden:
+                    return False
+
+        players = list(game.players)
+        results = await asyncio.gather(*(dms_open(player) for player in players))
+        closed_dm_users = [player for player, is_open in zip(players, results) if not is_open]
 
         if closed_dm_users:
             closed_dm_mentions = " ".join([user.mention for user in closed_dm_users])
@@ -85,103 +398,189 @@ class StoryGame(commands.Cog):
             )
             return
 
-        game['started'] = True
-        players = list(game['players'])
+        game.started = True
         random.shuffle(players)
+        game.turn_order = players
+        # Lanes only run in parallel if each one has its own writer.
+        game.lanes = min(game.lanes, len(players))
+        game.story = game.story[:game.lanes]
+        await self.store.save(game)
 
         await interaction.followup.send("The game is starting now! Check your DMs for your turn.", ephemeral=False)
+        self.launch(game)
 
-        for round_num in range(1, game['num_rounds'] + 1):
-            await game['original_channel'].send(f"Starting Round {round_num}")
+    def launch(self, game):
+        self.runners[game.game_id] = asyncio.create_task(self.run_game(game.game_id))
 
-            for player in players:
-                previous_sentence = game['story'][-1] if game['story'] else "Start the story!"
+    async def run_game(self, game_id: int):
+        # Runs in the background rather than inside the Start interaction, and
+        # checkpoints after every contribution so a restart resumes at the same
+        # step. Each step hands out the next num_lanes turns at once: lane i is
+        # written by player (i + step) % len(players), so every step prompts
+        # distinct players and each lane is passed along like the paper game.
+        # With a single lane this is the classic turn order.
+        game = self.games[game_id]
+        players = game.turn_order
+        num_lanes = game.lanes
+        total_turns = game.num_rounds * len(players)
+        resumed = game.turn_deadline is not None
+        try:
+            while game.turn * num_lanes < total_turns:
+                first = game.turn * num_lanes
+                turns = [(lane, players[(lane + game.turn) % len(players)])
+                         for lane in range(min(num_lanes, total_turns - first))]
 
-                await game['original_channel'].send(f"It's now the next person's turn to add to the story! Check your DM, you've been pinged!")
+                if game.turn_deadline is None:
+                    if first % len(players) < num_lanes:
+                        await self.outbound.send(game.original_channel, f"Starting Round {(first + num_lanes - 1) // len(players) + 1}", merge=True)
 
-                await player.send(f"It's your turn! The previous sentence was:\n\n{previous_sentence}")
+                    game.turn_deadline = time.time() + game.wait_time
+                    await self.store.save(game)
 
-                def check(m):
-                    return m.author == player and isinstance(m.channel, discord.DMChannel)
+                    if num_lanes == 1:
+                        notice = "It's now the next person's turn to add to the story! Check your DM, you've been pinged!"
+                    else:
+                        notice = "Everyone's passing their stories along! Check your DMs, you've been pinged!"
+                    await asyncio.gather(
+                        self.outbound.send(game.original_channel, notice, merge=True),
+                        *(self.prompt_turn(game, lane, player) for lane, player in turns)
+                    )
+                elif resumed:
+                    # The checkpoint is written before the prompts go out, so
+                    # after a crash some may never have been sent. Prompting
+                    # again is harmless; waiting on an unprompted player isn't.
+                    await asyncio.gather(*(self.prompt_turn(game, lane, player)
+                                           for lane, player in turns if lane not in game.done_lanes))
+                resumed = False
 
-                try:
-                    msg = await self.bot.wait_for('message', check=check, timeout=game['wait_time'])
-                    game['story'].append(msg.content)
-                    await player.send("Your contribution has been added to the story!")
-                except asyncio.TimeoutError:
-                    await player.send("You didn't respond in time. Skipping your turn.")
+                await asyncio.gather(*(self.play_turn(game, lane, player)
+                                       for lane, player in turns if lane not in game.done_lanes))
 
-        await self.end_game(interaction, game_id)
+                game.turn += 1
+                game.turn_deadline = None
+                game.done_lanes.clear()
+                await self.store.save(game)
 
-    async def end_game(self, interaction: discord.Interaction, game_id: int):
-        game = self.games[game_id]
-        full_story = " ".join(game['story'])
-        await game['original_channel'].send("The story is complete! Here's what you all wrote:")
+            await self.end_game(game_id)
+        except Exception:
+            logger.exception("Error in story game %s", game_id, extra={"game_id": game_id})
+        finally:
+            self.runners.pop(game_id, None)
 
-        if len(full_story) <= 1999:
-            await game['original_channel'].send(full_story)
+    async def prompt_turn(self, game, lane, player):
+        story = game.story[lane]
+        previous_sentence = story[-1] if story else "Start the story!"
+        if game.lanes == 1:
+            await self.outbound.send(player, f"It's your turn! The previous sentence was:\n\n{previous_sentence}", merge=True)
         else:
+            await self.outbound.send(player, f"It's your turn to add to story {lane + 1}! The previous sentence was:\n\n{previous_sentence}", merge=True)
+
+    async def play_turn(self, game, lane, player):
+        try:
+            content = await self.wait_for_turn(player, max(0, game.turn_deadline - time.time()))
+            game.story[lane].append(content)
+            reply = "Your contribution has been added to the story!"
+        except asyncio.TimeoutError:
+            reply = "You didn't respond in time. Skipping your turn."
+
+        game.done_lanes.add(lane)
+        await self.store.save(game)
+        await self.outbound.send(player, reply, merge=True)
+
+    async def end_game(self, game_id: int):
+        game = self.games[game_id]
+        # Everything is queued at once so short stories can be merged into
+        # fewer messages by the outbound scheduler.
+        sends = [self.outbound.send(game.original_channel, "The story is complete! Here's what you all wrote:", merge=True)]
+
+        for lane, story in enumerate(game.story):
+            full_story = " ".join(story)
+            if game.lanes > 1:
+                full_story = f"**Story {lane + 1}:** {full_story}"
+
             parts = [full_story[i:i + 1999] for i in range(0, len(full_story), 1999)]
-            for part in parts:
-                await game['original_channel'].send(part)
+            sends += [self.outbound.send(game.original_channel, part, merge=True) for part in parts]
+        await asyncio.gather(*sends)
 
-        del self.games[game_id]
+        self.games.remove(game_id)
+        await self.store.delete(game_id)
 
     async def cancel_game(self, interaction: discord.Interaction, game_id: int):
         game = self.games[game_id]
-        await game['original_channel'].send("The game has been cancelled.")
-        del self.games[game_id]
+        runner = self.runners.pop(game_id, None)
+        if runner:
+            runner.cancel()
+        await self.outbound.send(game.original_channel, "The game has been cancelled.", merge=True)
+        self.games.remove(game_id)
+        await self.store.delete(game_id)
         await interaction.response.send_message("The game has been cancelled.", ephemeral=True)
 
     async def force_cancel_game(self, interaction: discord.Interaction):
-        for game_id, game in self.games.items():
-            if game['host'] == interaction.user:
-                await self.cancel_game(interaction, game_id)
-                return
+        game = self.games.hosted_by(interaction.user)
+        if game:
+            await self.cancel_game(interaction, game.game_id)
+            return
         await interaction.response.send_message("You are not hosting any games.", ephemeral=True)
 
 
 class StoryGameView(discord.ui.View):
-    def __init__(self, game, interaction, game_id):
+    def __init__(self, game, game_id):
         super().__init__(timeout=None)
         self.game = game
-        self.interaction = interaction
         self.game_id = game_id
+        # Fixed custom ids let the view be re-registered for its lobby
+        # message after a restart.
+        self.start_button.custom_id = f"story_game:{game_id}:start"
+        self.join_button.custom_id = f"story_game:{game_id}:join"
+        self.leave_button.custom_id = f"story_game:{game_id}:leave"
 
     @discord.ui.button(label="Start", style=discord.ButtonStyle.green)
     async def start_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user == self.game.games[self.game_id]['host']:
+        game = self.game.games.get(self.game_id)
+        if game is None:
+            await interaction.response.send_message("This game is no longer running.", ephemeral=True)
+        elif interaction.user == game.host:
             await interaction.response.defer()
             await self.game.start_game(interaction, self.game_id)
-            self.disable_all_items()
-            await interaction.edit_original_response(view=self)
+            if game.started:
+                for item in self.children:
+                    item.disabled = True
+                await interaction.edit_original_response(view=self)
         else:
             await interaction.response.send_message("Only the host can start the game.", ephemeral=True)
 
     @discord.ui.button(label="Join", style=discord.ButtonStyle.blurple)
     async def join_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        game = self.game.games[self.game_id]
-        if game['started']:
+        game = self.game.games.get(self.game_id)
+        if game is None:
+            await interaction.response.send_message("This game is no longer running.", ephemeral=True)
+        elif game.started:
             await interaction.response.send_message("Sorry, the game has already started.", ephemeral=True)
-        elif len(game['players']) >= game['max_players']:
+        elif len(game.players) >= game.max_players:
             await interaction.response.send_message("This game is full.", ephemeral=True)
-        elif interaction.user not in game['players']:
-            game['players'].add(interaction.user)
+        elif interaction.user not in game.players and self.game.games.game_of(interaction.user):
+            await interaction.response.send_message("You're already playing in another game.", ephemeral=True)
+        elif interaction.user not in game.players:
+            self.game.games.add_player(game, interaction.user)
+            await self.game.store.save(game)
             await interaction.response.send_message("You've joined the game!", ephemeral=True)
-            await game['original_channel'].send(f"{interaction.user.mention} has joined the game!")
+            await self.game.outbound.send(game.original_channel, f"{interaction.user.mention} has joined the game!", merge=True)
         else:
             await interaction.response.send_message("You've already joined the game.", ephemeral=True)
 
     @discord.ui.button(label="Leave", style=discord.ButtonStyle.red)
     async def leave_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        game = self.game.games[self.game_id]
-        if game['started']:
+        game = self.game.games.get(self.game_id)
+        if game is None:
+            await interaction.response.send_message("This game is no longer running.", ephemeral=True)
+        elif game.started:
             await interaction.response.send_message("Sorry, the game has already started. You can't leave now.", ephemeral=True)
-        elif interaction.user in game['players'] and interaction.user != game['host']:
-            game['players'].remove(interaction.user)
+        elif interaction.user in game.players and interaction.user != game.host:
+            self.game.games.remove_player(game, interaction.user)
+            await self.game.store.save(game)
             await interaction.response.send_message("You've left the game.", ephemeral=True)
-            await game['original_channel'].send(f"{interaction.user.mention} has left the game.")
-        elif interaction.user == game['host']:
+            await self.game.outbound.send(game.original_channel, f"{interaction.user.mention} has left the game.", merge=True)
+        elif interaction.user == game.host:
             await interaction.response.send_message("The host cannot leave the game. Use /cancel_story to end the game.", ephemeral=True)
         else:
             await interaction.response.send_message("You haven't joined the game yet.", ephemeral=True)
@@ -0,0 +1,121 @@
+import json
+from database import AsyncDatabase
+
+MIGRATIONS = [
+    # 1: one row per game, rewritten after every change to the game
+    '''
+    CREATE TABLE IF NOT EXISTS story_games
+        (game_id INTEGER PRIMARY KEY,
+         channel_id INTEGER,
+         message_id INTEGER,
+         host_id INTEGER,
+         player_ids TEXT,
+         wait_time INTEGER,
+         num_rounds INTEGER,
+         max_players INTEGER,
+         started INTEGER,
+         story TEXT,
+         turn INTEGER,
+         turn_deadline REAL);
+    ''',
+    # 2: parallel lanes; story becomes a list of lanes, each a list of sentences
+    '''
+    ALTER TABLE story_games ADD COLUMN lanes INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE story_games ADD COLUMN done_lanes TEXT NOT NULL DEFAULT '[]';
+    UPDATE story_games SET story = json_array(json(story));
+    ''',
+    # 3: sharding; games belong to the process owning their guild, and DMs,
+    # which only reach shard 0, are relayed to other processes' turns
+    '''
+    ALTER TABLE story_games ADD COLUMN guild_id INTEGER;
+    CREATE TABLE IF NOT EXISTS remote_turns
+        (user_id INTEGER PRIMARY KEY);
+    CREATE TABLE IF NOT EXISTS remote_replies
+        (user_id INTEGER PRIMARY KEY, content TEXT);
+    ''',
+]
+
+
+class StoryStore(AsyncDatabase):
+    """Checkpoints of lobbies and running story games.
+
+    ``player_ids`` is in turn order once the game has started, and
+    ``turn_deadline`` is the wall-clock time the current step times out, or
+    NULL between steps.
+    """
+
+    def __init__(self, path='story_games.db'):
+        super().__init__(path)
+
+    async def load(self):
+        await self.migrate(MIGRATIONS)
+
+    async def save(self, game):
+        players = game.turn_order if game.started else game.players
+        await self.execute('''INSERT OR REPLACE INTO story_games
+                              (game_id, channel_id, message_id, host_id, player_ids, wait_time, num_rounds,
+                               max_players, started, story, turn, turn_deadline, lanes, done_lanes, guild_id)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (game.game_id, game.original_channel.id, game.message_id, game.host.id,
+                            json.dumps([player.id for player in players]), game.wait_time, game.num_rounds,
+                            game.max_players, int(game.started), json.dumps(game.story), game.turn,
+                            game.turn_deadline, game.lanes, json.dumps(sorted(game.done_lanes)),
+                            getattr(getattr(game.original_channel, 'guild', None), 'id', None)))
+
+    async def delete(self, game_id):
+        await self.execute("DELETE FROM story_games WHERE game_id = ?", (game_id,))
+
+    async def saved_games(self):
+        rows = await self.fetchall('''SELECT game_id, channel_id, message_id, host_id, player_ids, wait_time,
+                                      num_rounds, max_players, started, story, turn, turn_deadline, lanes, done_lanes,
+                                      guild_id FROM story_games ORDER BY game_id''')
+        return [{
+            "game_id": row[0],
+            "channel_id": row[1],
+            "message_id": row[2],
+            "host_id": row[3],
+            "player_ids": json.loads(row[4]),
+            "wait_time": row[5],
+            "num_rounds": row[6],
+            "max_players": row[7],
+            "started": bool(row[8]),
+            "story": json.loads(row[9]),
+            "turn": row[10],
+            "turn_deadline": row[11],
+            "lanes": row[12],
+            "done_lanes": json.loads(row[13]),
+            "guild_id": row[14],
+        } for row in rows]
+
+    async def open_remote_turn(self, user_id):
+        def _open(conn):
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO remote_turns (user_id) VALUES (?)", (user_id,))
+                conn.execute("DELETE FROM remote_replies WHERE user_id = ?", (user_id,))
+        await self.run(_open)
+
+    async def close_remote_turn(self, user_id):
+        def _close(conn):
+            with conn:
+                conn.execute("DELETE FROM remote_turns WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM remote_replies WHERE user_id = ?", (user_id,))
+        await self.run(_close)
+
+    async def remote_turn_users(self):
+        return {row[0] for row in await self.fetchall("SELECT user_id FROM remote_turns")}
+
+    async def post_remote_reply(self, user_id, content):
+        # Only the first reply to an open turn is kept.
+        await self.execute('''INSERT OR IGNORE INTO remote_replies (user_id, content)
+                              SELECT ?, ? WHERE EXISTS (SELECT 1 FROM remote_turns WHERE user_id = ?)''',
+                           (user_id, content, user_id))
+
+    async def take_remote_replies(self, user_ids):
+        def _take(conn):
+            placeholders = ", ".join("?" * len(user_ids))
+            with conn:
+                rows = conn.execute(f"SELECT user_id, content FROM remote_replies WHERE user_id IN ({placeholders})",
+                                    user_ids).fetchall()
+                conn.execute(f"DELETE FROM remote_replies WHERE user_id IN ({placeholders})", user_ids)
+            return rows
+        return await self.run(_take)
@@ -0,0 +1,39 @@
+from chatgpt import ChannelHistoryCache
+
+
+def test_messages_during_fetch_are_kept():
+    history = ChannelHistoryCache(per_channel=5)
+    history.begin(1)
+    assert 1 in history
+    assert history.recent(1, 5) is None
+    history.add(1, 20, "new")
+    history.edit(1, 11, "edited")
+    history.delete(1, 12)
+    history.seed(1, [(10, "a"), (11, "b"), (12, "c")])
+    assert history.recent(1, 5) == ["a", "edited", "new"]
+
+
+def test_seed_keeps_newest_per_channel():
+    history = ChannelHistoryCache(per_channel=2)
+    history.begin(1)
+    history.add(1, 5, "live")
+    history.seed(1, [(1, "a"), (2, "b"), (3, "c")])
+    assert history.recent(1, 2) == ["c", "live"]
+
+
+def test_abort_only_drops_a_loading_channel():
+    history = ChannelHistoryCache()
+    history.seed(1, [(1, "a")])
+    history.begin(1)
+    history.abort(1)
+    assert history.recent(1, 1) == ["a"]
+    history.begin(2)
+    history.abort(2)
+    assert 2 not in history
+
+
+def test_zero_or_negative_limit_returns_nothing():
+    history = ChannelHistoryCache(per_channel=5)
+    history.seed(1, [(1, "a"), (2, "b")])
+    assert history.recent(1, 0) == []
+    assert history.recent(1, -3) == []
@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+from chat_cache import ResponseCache, fingerprint
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "chat_cache.db"))
+    asyncio.run(cache.load())
+    yield cache
+    asyncio.run(cache.close())
+
+
+def test_keys_are_scoped_by_channel_and_context(cache):
+    context = fingerprint("model", "alice: hi")
+    key = cache.key("What did we just talk about?", 1, context)
+    assert cache.key("what did we just talk about", 1, context) == key
+    assert cache.key("What did we just talk about?", 2, context) != key
+    assert cache.key("What did we just talk about?", 1, fingerprint("model", "bob: hi")) != key
+
+
+def test_reply_is_not_served_in_another_channel(cache):
+    context = fingerprint("model", "")
+    asyncio.run(cache.put(cache.key("hello", 1, context), "hi from channel 1"))
+    assert asyncio.run(cache.get(cache.key("hello", 1, context))) == "hi from channel 1"
+    assert asyncio.run(cache.get(cache.key("hello", 2, context))) is None
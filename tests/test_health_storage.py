@@ -0,0 +1,102 @@
+import asyncio
+import re
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from health_storage import CHART_QUERIES, MIGRATIONS, HealthStore
+from database import split_statements
+
+USER = 42
+
+
+def baseline_db(path):
+    # A health_data.db as created before migrations existed: the original
+    # schema with user_version still 0.
+    conn = sqlite3.connect(path)
+    for statement in split_statements(MIGRATIONS[0]):
+        conn.execute(statement)
+    conn.execute("INSERT INTO sleep_entries (user_id, hours_slept, score, date) VALUES (?, 7.5, 80, '2024-03-01')", (USER,))
+    conn.execute("INSERT INTO diet_entries (user_id, food, calories, date, time) VALUES (?, 'soup', 300, '2024-03-01', '12:30')", (USER,))
+    conn.execute("INSERT INTO diet_entries (user_id, food, calories, date, time) VALUES (?, 'tea', 5, '2024-03-02', NULL)", (USER,))
+    conn.execute("INSERT INTO journal_entries (user_id, entry, date, time, mood) VALUES (?, 'hi', '2024-03-01', '21:05', 3)", (USER,))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "health_data.db")
+    baseline_db(path)
+    store = HealthStore(path)
+    asyncio.run(store.create_tables())
+    yield store
+    asyncio.run(store.close())
+
+
+def query(store, sql, params=()):
+    return asyncio.run(store.fetchall(sql, params))
+
+
+def test_migration_sets_version_and_backfills_recorded_at(store):
+    assert query(store, "PRAGMA user_version") == [(len(MIGRATIONS),)]
+    assert query(store, "SELECT recorded_at FROM sleep_entries") == [("2024-03-01 00:00:00",)]
+    assert query(store, "SELECT recorded_at FROM diet_entries ORDER BY id") == [
+        ("2024-03-01 12:30:00",), ("2024-03-02 00:00:00",)]
+    assert query(store, "SELECT recorded_at FROM journal_entries") == [("2024-03-01 21:05:00",)]
+
+
+def test_migration_is_idempotent(store):
+    assert asyncio.run(store.migrate(MIGRATIONS)) == len(MIGRATIONS)
+    assert query(store, "SELECT COUNT(*) FROM diet_entries") == [(2,)]
+
+
+def test_data_version_is_per_user_and_shared_between_processes(store):
+    other_process = HealthStore(store.path)
+
+    async def run():
+        before = await other_process.data_version(USER, "diet")
+        await store.add_diet_entry(USER, "rice", 200, 4, 1, 40, 1, datetime(2024, 3, 3, 12))
+        after = await other_process.data_version(USER, "diet")
+        await store.add_diet_entry(USER + 1, "rice", 200, 4, 1, 40, 1, datetime(2024, 3, 3, 12))
+        return before, after, await other_process.data_version(USER, "diet"), await store.data_version(USER, "sleep")
+
+    try:
+        assert asyncio.run(run()) == (0, 1, 1, 0)
+    finally:
+        asyncio.run(other_process.close())
+
+
+def traced_plans(store, call):
+    """Run ``call`` and return the query plan of every SELECT it executed."""
+    statements = []
+
+    async def run():
+        await store.run(lambda conn: conn.set_trace_callback(statements.append))
+        try:
+            await call()
+        finally:
+            await store.run(lambda conn: conn.set_trace_callback(None))
+        return [await store.fetchall(f"EXPLAIN QUERY PLAN {sql}")
+                for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+    plans = asyncio.run(run())
+    assert plans
+    return [" ".join(row[-1] for row in plan) for plan in plans]
+
+
+@pytest.mark.parametrize("name, call, index", [
+    ("profile", lambda store: store.latest_entries(USER), "idx_.*_user_recorded"),
+    ("todo", lambda store: store.todos(USER, "2024-03-01"), "idx_todo_user_date"),
+    ("journal date", lambda store: store.latest_journal_date(USER), "idx_journal_user_recorded"),
+    ("journal entry", lambda store: store.journal_entry(USER, "2024-03-01"), "idx_journal_user_recorded"),
+    ("tdee", lambda store: store.latest_body_entry(USER), "idx_body_user_recorded"),
+] + [
+    (f"chart {data_type}",
+     lambda store, data_type=data_type: store.chart_rows(USER, data_type, datetime.now() - timedelta(days=30), datetime.now()),
+     f"idx_{data_type}_user_recorded")
+    for data_type in CHART_QUERIES
+])
+def test_hot_queries_use_user_indexes(store, name, call, index):
+    for plan in traced_plans(store, lambda: call(store)):
+        assert re.search(f"USING (COVERING )?INDEX {index}", plan), (name, plan)
+        assert "USE TEMP B-TREE" not in plan, (name, plan)
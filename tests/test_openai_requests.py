@@ -0,0 +1,154 @@
+import asyncio
+import time
+import types
+import pytest
+from aiohttp import web
+import chatgpt
+
+COMPLETION = {
+    "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": chatgpt.MODEL,
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "hello"}, "finish_reason": "stop"}],
+}
+
+
+class FakeOpenAI:
+    """A local stand-in for the completions endpoint.
+
+    Each request takes the next behaviour from ``script``; once it is empty
+    every request succeeds after ``delay`` seconds.
+    """
+
+    def __init__(self, script=(), delay=0):
+        self.script = list(script)
+        self.delay = delay
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def completions(self, request):
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            behaviour = self.script.pop(0) if self.script else "ok"
+            if behaviour == "429":
+                return web.json_response({"error": {"message": "slow down", "type": "rate_limit"}},
+                                         status=429, headers={"Retry-After": "0.05"})
+            if behaviour == "503":
+                return web.json_response({"error": {"message": "unavailable"}}, status=503)
+            if behaviour == "slow":
+                await asyncio.sleep(1)
+            await asyncio.sleep(self.delay)
+            return web.json_response(COMPLETION)
+        finally:
+            self.active -= 1
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.completions)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(chatgpt, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(chatgpt, "REQUEST_TIMEOUT", 0.3)
+    monkeypatch.setattr(chatgpt, "MAX_RETRIES", 2)
+    monkeypatch.setattr(chatgpt, "RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(chatgpt, "MAX_CONCURRENT_REQUESTS", 2)
+    # Pointed at the fake server by run_against, restored afterwards.
+    monkeypatch.setattr(chatgpt, "OPENAI_BASE_URL", None)
+
+
+def run_against(server, test):
+    async def run():
+        async with server:
+            chatgpt.OPENAI_BASE_URL = server.base_url
+            cog = chatgpt.ChatGPTCommands(types.SimpleNamespace())
+            try:
+                return await test(cog)
+            finally:
+                await cog.client.close()
+    return asyncio.run(run())
+
+
+def test_retries_rate_limits_and_server_errors():
+    server = FakeOpenAI(["429", "503"])
+
+    async def test(cog):
+        started = time.perf_counter()
+        completion = await cog.create_completion([{"role": "user", "content": "hi"}])
+        return completion, time.perf_counter() - started
+
+    completion, elapsed = run_against(server, test)
+    assert completion.choices[0].message.content == "hello"
+    assert server.requests == 3
+    # The 429's Retry-After is honoured before the second attempt.
+    assert elapsed >= 0.05
+
+
+def test_gives_up_after_max_retries():
+    server = FakeOpenAI(["503"] * 5)
+
+    async def test(cog):
+        with pytest.raises(Exception) as excinfo:
+            await cog.create_completion([{"role": "user", "content": "hi"}])
+        return excinfo.value
+
+    error = run_against(server, test)
+    assert type(error).__name__ == "InternalServerError"
+    assert server.requests == chatgpt.MAX_RETRIES + 1
+
+
+def test_slow_responses_time_out():
+    server = FakeOpenAI(["slow"] * 5)
+
+    async def test(cog):
+        started = time.perf_counter()
+        with pytest.raises(Exception) as excinfo:
+            await cog.create_completion([{"role": "user", "content": "hi"}])
+        return excinfo.value, time.perf_counter() - started
+
+    error, elapsed = run_against(server, test)
+    assert type(error).__name__ == "APITimeoutError"
+    assert server.requests == chatgpt.MAX_RETRIES + 1
+    assert elapsed < 3
+
+
+def test_slow_then_ok_is_retried():
+    server = FakeOpenAI(["slow"])
+
+    async def test(cog):
+        return await cog.create_completion([{"role": "user", "content": "hi"}])
+
+    assert run_against(server, test).choices[0].message.content == "hello"
+    assert server.requests == 2
+
+
+def test_semaphore_caps_concurrency_and_queue_drains():
+    server = FakeOpenAI(delay=0.2)
+
+    async def test(cog):
+        depths = []
+        requests = [asyncio.create_task(cog.create_completion([{"role": "user", "content": str(i)}]))
+                    for i in range(6)]
+        while not all(request.done() for request in requests):
+            depths.append((cog.queue_depth, cog.in_flight))
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*requests)
+        return depths, cog.queue_depth, cog.in_flight
+
+    depths, queue_depth, in_flight = run_against(server, test)
+    assert server.max_active == 2
+    assert max(depth for depth, _ in depths) == 4
+    assert max(active for _, active in depths) == 2
+    assert (queue_depth, in_flight) == (0, 0)
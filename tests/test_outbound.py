@@ -0,0 +1,31 @@
+import asyncio
+import time
+import outbound
+
+
+class Channel:
+    def __init__(self, id):
+        self.id = id
+        self.sent = []
+
+    async def send(self, content, **kwargs):
+        self.sent.append((time.monotonic(), content))
+        return content
+
+
+def test_buckets_outlive_their_worker_until_the_window_empties():
+    async def run():
+        scheduler = outbound.OutboundScheduler(route_limits={"channel": (2, 0.2)})
+        first, second = Channel(1), Channel(2)
+        await asyncio.gather(scheduler.send(first, "a"), scheduler.send(first, "b"))
+        # The worker is gone but the route is still rate limited.
+        assert "channel:1" in scheduler._buckets
+        await scheduler.send(first, "c")
+        assert first.sent[2][0] - first.sent[0][0] >= 0.19
+
+        await asyncio.sleep(0.25)
+        await scheduler.send(second, "d")
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert "channel:1" not in scheduler._buckets
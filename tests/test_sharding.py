@@ -0,0 +1,12 @@
+import pytest
+import sharding
+
+
+def test_shard_ranges_cover_every_shard_once():
+    assert sharding.shard_ranges(5, 2) == [[0, 1], [2, 3, 4]]
+    assert sharding.shard_ranges(4, 4) == [[0], [1], [2], [3]]
+
+
+def test_more_processes_than_shards_is_rejected():
+    with pytest.raises(ValueError):
+        sharding.shard_ranges(2, 4)
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from snipe import RecentDeletions, deleted_row, hot_row, row_key
+from snipe_storage import SnipeStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    async def open_store():
+        store = SnipeStore(str(tmp_path / "snipe_data.db"))
+        await store.load()
+        return store
+    store = asyncio.run(open_store())
+    yield store
+    asyncio.run(store.close())
+
+
+def test_paging_from_hot_rows_keeps_rows_with_the_same_timestamp(store):
+    # A purge stamps all of its rows with one timestamp.
+    rows = [(message_id, 7, 1, 2, f"message {message_id}", "2026-01-01T00:00:00") for message_id in (100, 101, 102)]
+
+    async def run():
+        store.queue(rows)
+        newest = hot_row(rows[-1])
+        return await store.older_deleted(1, 2, 5, before=row_key(newest))
+
+    older = asyncio.run(run())
+    assert [row[0] for row in older] == [101, 100]
+
+
+def test_deleted_row_is_stored_under_its_message_id(store):
+    row = deleted_row(555, (7, 1, 2, "hello"))
+
+    async def run():
+        store.queue([row, row])
+        return await store.older_deleted(1, 2, 5)
+
+    assert asyncio.run(run()) == [hot_row(row)]
+
+
+def test_failed_flush_keeps_rows_queued(store):
+    rows = [deleted_row(message_id, (7, 1, 2, "hello")) for message_id in (300, 301)]
+
+    async def run():
+        await store.execute("ALTER TABLE deleted_messages RENAME TO moved_away")
+        store.queue(rows)
+        with pytest.raises(Exception):
+            await store.flush()
+        assert store.pending == rows
+        await store.execute("ALTER TABLE moved_away RENAME TO deleted_messages")
+        return await store.older_deleted(1, 2, 5)
+
+    assert [row[0] for row in asyncio.run(run())] == [301, 300]
+    assert store.pending == []
+
+
+def test_empty_seeds_are_not_kept():
+    recent = RecentDeletions(per_channel=2, max_entries=2)
+    for channel_id in range(100):
+        recent.seed(channel_id, [])
+    assert recent.latest(5) is None
+    assert recent.entries == 0
+    recent.seed(1, [("row",)])
+    assert recent.latest(1) == [("row",)]
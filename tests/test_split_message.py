@@ -0,0 +1,28 @@
+from chatgpt import DISCORD_MESSAGE_LIMIT, split_message
+
+
+def test_short_message_is_one_chunk():
+    assert split_message("hello") == ["hello"]
+
+
+def test_chunks_fit_and_keep_words():
+    content = " ".join(f"word{i}" for i in range(2000))
+    chunks = split_message(content)
+    assert all(len(chunk) <= DISCORD_MESSAGE_LIMIT for chunk in chunks)
+    assert " ".join(chunks).split() == content.split()
+
+
+def test_code_block_is_reopened_with_its_language():
+    content = "```python\n" + "print('x')\n" * 400 + "```"
+    chunks = split_message(content)
+    assert len(chunks) > 1
+    assert chunks[0].endswith("\n```")
+    assert all(chunk.startswith("```python\n") for chunk in chunks)
+    assert all(chunk.count("```") % 2 == 0 for chunk in chunks)
+
+
+def test_long_fence_line_terminates():
+    for content in ("Run this: ```" + "word " * 600 + "``` done", "```" + "a" * 5000):
+        chunks = split_message(content)
+        assert all(len(chunk) <= DISCORD_MESSAGE_LIMIT for chunk in chunks)
+        assert len(chunks) <= 4